@@ -1,6 +1,8 @@
+import asyncio
+
 from utils.url import get_bp
 from utils.wrapper import request_wrapper, get_param
-from models.task import Task
+from models.task import Task, AsyncTask
 
 bp = get_bp(__file__, __name__)
 
@@ -22,3 +24,47 @@ def test():
     )
 
     return task
+
+
+@bp.route("/test_sync")
+@request_wrapper()
+def test_sync():
+    id = get_param("id")
+
+    if not id:
+        raise Exception("id is required.")
+
+    # 与 test_async 相同的两次查询，顺序执行，用于对比
+    task = Task.find_one(
+        filter={
+            "_id": id,
+        },
+        sort=[("create_time", -1)],
+        return_json=True,
+    )
+    count = Task.count({"_deleted": None})
+
+    return {"task": task, "count": count}
+
+
+@bp.route("/test_async")
+@request_wrapper()
+async def test_async():
+    id = get_param("id")
+
+    if not id:
+        raise Exception("id is required.")
+
+    # 同一个请求内并发发起多个查询
+    task, count = await asyncio.gather(
+        AsyncTask.find_one(
+            filter={
+                "_id": id,
+            },
+            sort=[("create_time", -1)],
+            return_json=True,
+        ),
+        AsyncTask.count({"_deleted": None}),
+    )
+
+    return {"task": task, "count": count}
@@ -3,22 +3,44 @@ import time
 import signal
 import sys
 import os
-import importlib
 import traceback
 
-from flask import Flask, request, g
+from flask import Flask, Response, request, g
 from flask_restful import Resource, Api
 from flask_cors import CORS
 
 # from utils.encode_util import CustomJSONEncoder
-from debug_toolbar.panels import register_mongo_listener
+from debug_toolbar.mongo_listener import register_mongo_listener, global_request_data
+from debug_toolbar.query_stats import query_stats, register_query_stats_listener
+from debug_toolbar.slow_query import register_slow_query_listener
+from debug_toolbar.query_analyzer import register_query_analysis
+from debug_toolbar.traffic import register_traffic_capture
+from debug_toolbar.shared_store import init_store, get_store
+from utils.mongo_tool import MongoBase, config, pool_listener
+from utils.mongo_index import sync_all_indexes
+from utils.route_manifest import register_routes
+from utils.log_queue import install_queue_logging
+from utils.server_timing import register_server_timing
+from utils.metrics import init_metrics, register_metrics, render_metrics
 
 
 app = Flask(__name__)
 CORS(app)
 api = Api(app)
 env = os.getenv("DEPLOY_ENV", "dev")
-register_mongo_listener()
+init_store(config)
+# prometheus 指标，需要在创建 MongoClient 之前注册监听器
+init_metrics(config)
+register_mongo_listener(config=config)
+# 查询 shape 统计，开发环境始终开启，生产环境在 [QUERY_STATS] 中开启
+register_query_stats_listener(config)
+register_slow_query_listener(config)
+# 单个请求的 N+1 / 重复语句分析，严格模式下检查语句预算
+register_query_analysis(app, config)
+# 录制真实流量，用 benchmarks/replay_traffic.py 回放压测
+register_traffic_capture(app, config)
+# 所有响应加上 Server-Timing 头：总耗时、mongo 次数和耗时、序列化耗时、视图耗时
+register_server_timing(app, config)
 
 
 def exit_gracefully(*args):
@@ -31,6 +53,9 @@ def exit_gracefully(*args):
         app.logger.error(str(e))
     finally:
         app.logger.info("Exiting...")
+        # 写出队列中剩余的日志
+        if log_handler:
+            log_handler.flush()
         sys.exit(0)
 
 
@@ -60,6 +85,10 @@ if not app.debug:
     logging.getLogger().handlers = gunicorn_logger.handlers
     logging.getLogger().setLevel(logging.DEBUG)
 
+# 开启后日志先进入队列，由后台线程批量写入上面的 handler，请求线程不做 I/O
+log_handler = install_queue_logging([logging.getLogger(), app.logger], config)
+
+if not app.debug:
     app.logger.info(f"Start Backend Server, env: {env}")
 
     signal.signal(signal.SIGINT, exit_gracefully)
@@ -82,62 +111,143 @@ class Home(Resource):
 api.add_resource(Home, "/")
 
 
-def is_route_file(filename):
-    return filename.startswith("api") and filename.endswith(".py")
+def is_endpoint_exposed(section):
+    """/_mongo/* 调试接口没有鉴权，只在开发环境或 section 中开启 EXPOSE_ENDPOINT 时注册"""
+    return app.debug or config.getboolean(section, "EXPOSE_ENDPOINT", fallback=False)
+
+
+class MongoPool(Resource):
+    @staticmethod
+    def get():
+        # 当前 worker 进程的 mongo 连接池使用情况
+        return pool_listener.stats(), 200
+
+
+if is_endpoint_exposed("DB_POOL"):
+    api.add_resource(MongoPool, "/_mongo/pool")
 
 
-def mod_name_to_route(mod_name):
-    parts = mod_name.split(".")
+class MongoQueryStats(Resource):
+    @staticmethod
+    def get():
+        # 当前 worker 进程按查询 shape 聚合的统计，按总耗时倒序
+        return query_stats.snapshot(), 200
+
+
+if is_endpoint_exposed("QUERY_STATS"):
+    api.add_resource(MongoQueryStats, "/_mongo/query_stats")
+
+
+class MongoQueries(Resource):
+    @staticmethod
+    def get():
+        # 当前 worker 进程最近采集到的 mongo 命令，生产环境需要开启 [MONGO_CAPTURE] 采样
+        store = get_store()
+        queries = store.queries() if store else global_request_data["mongo_queries"]
+        return [
+            {
+                "command": query.command,
+                "collection": query.collection,
+                "duration": query.duration,
+                "timestamp": query.timestamp,
+                "path": query.path,
+                "error": query.error,
+                "sql": query.sql,
+            }
+            for query in queries
+        ], 200
+
+
+if is_endpoint_exposed("MONGO_CAPTURE"):
+    api.add_resource(MongoQueries, "/_mongo/queries")
+
+
+class MongoIndexAdvice(Resource):
+    @staticmethod
+    def get():
+        # 按需重放 explain，只在访问时执行，结果缓存 ADVICE_CACHE_SECONDS 秒
+        from debug_toolbar.index_advisor import get_index_advice
 
-    last = parts[-1]
-    if last == "api":
-        # 只取前面的部分
-        parts = parts[:-1]
-    elif last.startswith("api_"):
-        # 只保留 api_ 后的部分
-        parts = parts[:-1] + [last[4:]]
+        return (
+            get_index_advice(ttl=config.getint("DB_INDEX", "ADVICE_CACHE_SECONDS", fallback=60)),
+            200,
+        )
 
-    # 将所有 _ 替换成 /
-    path_parts = []
-    for part in parts:
-        path_parts.extend(part.split("_"))
 
-    # 拼接为路由路径
-    route = "/" + "/".join(path_parts)
-    return route
+if is_endpoint_exposed("DB_INDEX"):
+    api.add_resource(MongoIndexAdvice, "/_mongo/index_advice")
 
 
-extra_files = []
+class Metrics(Resource):
+    @staticmethod
+    def get():
+        # Prometheus 文本格式，多进程模式下合并所有 worker 的指标
+        body, content_type = render_metrics()
+        return Response(body, content_type=content_type)
 
 
-def register_routes(package_path, package_name):
-    for root, dirs, files in os.walk(package_path):
-        for file in files:
-            if is_route_file(file):
-                try:
-                    # 动态 import 路由文件
-                    module_path = os.path.join(root, file)
-                    extra_files.append(module_path)
-                    rel_path = os.path.relpath(module_path, package_path)
-                    mod_name = rel_path.replace(os.sep, ".")[:-3]  # 去掉 .py
-                    full_mod_name = f"{package_name}.{mod_name}"
-                    module = importlib.import_module(full_mod_name)
-                    blueprint = getattr(module, "bp")
-                    url_prefix = blueprint.url_prefix
-                    if url_prefix:
-                        url_prefix = "/api" + url_prefix
-                    else:
-                        url_prefix = "/api" + mod_name_to_route(mod_name)
-                    app.register_blueprint(blueprint, url_prefix=url_prefix)
-                except Exception as e:
-                    logging.error(f"Failed to register route from {file}: {e}")
-                    logging.error(traceback.format_exc())
+if config.getboolean("METRICS", "ENABLED", fallback=False):
+    api.add_resource(Metrics, "/metrics")
 
 
 package_name = ["apis", "bp"]
 blueprints_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), *package_name)
-# 注册所有 api 子模块
-register_routes(blueprints_dir, ".".join(package_name))
+# 注册所有 api 子模块：路由清单按文件 mtime 失效，有效时启动不需要遍历目录；
+# 懒加载模式下不导入路由模块，第一次请求命中时再导入
+manifest_path = config.get("ROUTES", "MANIFEST", fallback="")
+extra_files = register_routes(
+    app,
+    blueprints_dir,
+    ".".join(package_name),
+    manifest_path=(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), manifest_path)
+        if manifest_path
+        else None
+    ),
+    lazy=config.getboolean("ROUTES", "LAZY", fallback=False),
+)
+# 请求指标按路由统计，需要在注册完路由之后
+register_metrics(app)
+
+# 同步 model 中声明的索引，也可以通过 flask mongo sync-indexes 手动执行
+if config.getboolean("DB_INDEX", "SYNC_ON_STARTUP", fallback=False):
+    try:
+        sync_all_indexes(MongoBase)
+    except Exception as e:
+        logging.error(f"Failed to sync indexes: {e}")
+        logging.error(traceback.format_exc())
+
+
+@app.cli.group()
+def mongo():
+    """MongoDB 相关命令"""
+
+
+@mongo.command("sync-indexes")
+def sync_indexes_command():
+    """创建或检查所有 model 中声明的索引"""
+    for report in sync_all_indexes(MongoBase):
+        print(
+            f"{report['collection']}: created {report['created']}, "
+            f"existing {report['existing']}, mismatched {report['mismatched']}"
+        )
+
+
+@app.cli.group()
+def metrics():
+    """Prometheus 指标相关命令"""
+
+
+@metrics.command("show")
+def show_metrics_command():
+    """输出 /metrics 的内容并用 prometheus_client 的解析器校验格式，不需要 Prometheus"""
+    from prometheus_client.parser import text_string_to_metric_families
+
+    body = render_metrics()[0].decode("utf-8")
+    families = list(text_string_to_metric_families(body))
+    print(body)
+    print(f"# {len(families)} metric families, {sum(len(it.samples) for it in families)} samples")
+
 
 # 重载观察文件
 logging.info(f"watch extra files: {extra_files}")
@@ -192,6 +302,7 @@ if app.debug:
     app.config["DEBUG_TB_PANELS"] = (
         "debug_toolbar.panels.RequestHistoryPanel",  # 历史请求面板
         "debug_toolbar.panels.MongoDebugPanel",  # MongoDB 查询面板
+        "debug_toolbar.panels.QueryStatsPanel",  # MongoDB 查询 shape 统计面板
         "flask_debugtoolbar.panels.sqlalchemy.SQLAlchemyDebugPanel",
         "flask_debugtoolbar.panels.route_list.RouteListDebugPanel",
         "flask_debugtoolbar.panels.logger.LoggingPanel",
@@ -0,0 +1,65 @@
+"""对比同步 / 异步 MongoBase 接口的吞吐量
+
+需要先启动本地 mongod 和后端服务，例如：
+
+    gunicorn app:app --bind 0.0.0.0:3004 --workers 2
+    python benchmarks/bench_async_mongo.py --host http://localhost:3004 --id 1
+
+同步接口为 /api/path1/path2/path3/test_sync，异步接口为 /api/path1/path2/path3/test_async，
+两者执行相同的 find_one 和 count，同步接口顺序执行，异步接口在一个请求内并发执行。
+"""
+import argparse
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ENDPOINTS = {
+    "sync": "/api/path1/path2/path3/test_sync",
+    "async": "/api/path1/path2/path3/test_async",
+}
+
+
+def run(url, concurrency, duration):
+    deadline = time.time() + duration
+
+    def worker():
+        ok = 0
+        error = 0
+        while time.time() < deadline:
+            try:
+                with urllib.request.urlopen(url, timeout=10) as resp:
+                    resp.read()
+                ok += 1
+            except Exception:
+                error += 1
+        return ok, error
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: worker(), range(concurrency)))
+    elapsed = time.time() - start_time
+
+    ok = sum(it[0] for it in results)
+    error = sum(it[1] for it in results)
+    return {"requests": ok, "errors": error, "rps": ok / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="http://localhost:3004")
+    parser.add_argument("--id", default="1", help="查询的 task _id")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    report = {}
+    for name, path in ENDPOINTS.items():
+        url = f"{args.host}{path}?id={args.id}"
+        report[name] = run(url, args.concurrency, args.duration)
+        print(f"{name:6s} {url}: {report[name]['rps']:.1f} req/s, errors {report[name]['errors']}")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
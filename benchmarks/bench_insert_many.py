@@ -0,0 +1,87 @@
+"""insert_many vs insert_stream 的吞吐量和峰值 RSS 对比，需要本地 mongod
+
+    python benchmarks/bench_insert_many.py --count 200000
+
+每种方式在独立子进程中执行，峰值 RSS 取自子进程的 ru_maxrss，写入的 collection 结束后会删除。
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+COLLECTION = "bench_insert"
+
+
+def make_docs(count):
+    for i in range(count):
+        yield {
+            "name": f"doc-{i}",
+            "status": i % 5,
+            "score": i / 3,
+            "tags": ["a", "b", "c"],
+            "payload": {"text": "x" * 512, "items": list(range(20))},
+        }
+
+
+def run_method(method, count, workers):
+    from utils.mongo_tool import MongoBase
+
+    class BenchInsert(MongoBase):
+        __collection__ = COLLECTION
+
+    BenchInsert.get_collection().drop()
+    start_time = time.time()
+    if method == "insert_many":
+        # 原有方式需要先把所有文档放进列表
+        BenchInsert.insert_many(list(make_docs(count)), ordered=False)
+    else:
+        result = BenchInsert.insert_stream(make_docs(count), ordered=False, workers=workers)
+        assert result["nInserted"] == count, result
+    elapsed = time.time() - start_time
+    inserted = BenchInsert.get_collection().count_documents({})
+    assert inserted == count, (method, inserted)
+    BenchInsert.get_collection().drop()
+
+    return {
+        "method": method,
+        "count": count,
+        "workers": workers,
+        "seconds": elapsed,
+        "docs_per_sec": count / elapsed,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=200000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--method", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.method:
+        print(json.dumps(run_method(args.method, args.count, args.workers)))
+        return
+
+    report = []
+    for method, workers in [("insert_many", 1), ("insert_stream", 1), ("insert_stream", args.workers)]:
+        output = subprocess.check_output(
+            [sys.executable, __file__, "--method", method, "--count", str(args.count), "--workers", str(workers)]
+        )
+        item = json.loads(output.decode().strip().splitlines()[-1])
+        report.append(item)
+        print(
+            "{method:14s} workers={workers}: {docs_per_sec:10.0f} docs/s, peak RSS {peak_rss_mb:8.1f} MB".format(
+                **item
+            )
+        )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
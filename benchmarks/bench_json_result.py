@@ -0,0 +1,78 @@
+"""get_json_result 微基准：json dumps/loads 往返 vs 单次遍历的 to_json_safe
+
+    python benchmarks/bench_json_result.py
+"""
+import datetime
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bson import ObjectId, Decimal128, Int64  # noqa: E402
+from utils.encode_util import CustomJSONEncoder, to_json_safe  # noqa: E402
+
+
+def dumps_loads(result):
+    # 优化前的实现
+    return json.loads(json.dumps(result, cls=CustomJSONEncoder))
+
+
+def make_doc(i):
+    now = datetime.datetime.now()
+    return {
+        "_id": ObjectId(),
+        "task_id": Int64(i),
+        "name": f"task-{i}",
+        "status": i % 5,
+        "score": i / 7,
+        "price": Decimal128("12.50"),
+        "enabled": bool(i % 2),
+        "tags": ["a", "b", "c"],
+        "owner": {"user_id": ObjectId(), "name": "owner", "login_time": now},
+        "steps": [
+            {"step": j, "start_time": now, "end_time": None, "ok": True}
+            for j in range(5)
+        ],
+        "raw": b"\x00\x01binary",
+        "create_time": now,
+        "update_time": now,
+    }
+
+
+SHAPES = {
+    "small (1 doc)": [make_doc(0)],
+    "medium (100 docs)": [make_doc(i) for i in range(100)],
+    "large (5000 docs)": [make_doc(i) for i in range(5000)],
+}
+
+
+def peak_memory(func, data):
+    tracemalloc.start()
+    func(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    for name, data in SHAPES.items():
+        assert to_json_safe(data) == dumps_loads(data), name
+
+        number = max(1, 2000 // len(data))
+        print(name)
+        for func in (dumps_loads, to_json_safe):
+            cost = min(timeit.repeat(lambda: func(data), number=number, repeat=5))
+            print(
+                "  {:12s} {:10.3f} ms/op  peak {:8.1f} KiB".format(
+                    func.__name__,
+                    cost / number * 1000,
+                    peak_memory(func, data) / 1024,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
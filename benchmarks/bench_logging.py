@@ -0,0 +1,121 @@
+"""每个请求的日志开销：同步 StreamHandler vs 队列 + 后台线程批量写入
+
+    python benchmarks/bench_logging.py --requests 20000
+
+每个请求模拟 app.py 的 before_request / after_request 两条 info 日志和 MongoBase 方法的 4 条 debug 日志。
+sink 为 file 时写入临时文件；为 slow 时每次 write 额外等待 --slow-write-us 微秒，
+模拟 stderr 管道被日志收集进程拖慢的情况。请求线程耗时只包含调用 logging 的时间，
+cpu 为请求线程自身的 CPU 时间（单进程压测时后台线程格式化会占用 GIL，墙钟时间包含这部分等待），
+队列模式另外给出写完所有日志的总耗时以及丢弃的条数。
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from utils.log_queue import BatchingQueueHandler  # noqa: E402
+
+LOG_FORMAT = "[%(asctime)s] %(levelname)s in %(pathname)s:%(lineno)d: %(message)s"
+
+
+class SlowStream(object):
+    def __init__(self, stream, delay):
+        self.stream = stream
+        self.delay = delay
+
+    def write(self, text):
+        time.sleep(self.delay)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def log_request(logger, i):
+    logger.info(f"Request start: GET /api/path1/path2/path3/test")
+    for j in range(4):
+        logging.debug(f"[find_one]: 0.52ms, task, {{'_id': '{i}'}}, [('create_time', -1)], ")
+    logging.info(f"Request end: GET /api/path1/path2/path3/test 200 OK {i / 100:.2f}ms")
+
+
+def make_target(sink, path, slow_write_us):
+    stream = open(path, "w", encoding="utf-8")
+    if sink == "slow":
+        stream = SlowStream(stream, slow_write_us / 1e6)
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    return handler, stream
+
+
+def run(mode, sink, requests, slow_write_us, queue_size):
+    path = tempfile.mktemp(suffix=".log")
+    target, stream = make_target(sink, path, slow_write_us)
+    handler = target
+    if mode == "queue":
+        handler = BatchingQueueHandler([target], queue_size=queue_size)
+
+    root = logging.getLogger()
+    app_logger = logging.getLogger("bench.app")
+    app_logger.propagate = False
+    root.handlers = [handler]
+    app_logger.handlers = [handler]
+    root.setLevel(logging.DEBUG)
+    app_logger.setLevel(logging.DEBUG)
+
+    start = time.perf_counter()
+    cpu_start = time.thread_time()
+    for i in range(requests):
+        log_request(app_logger, i)
+    request_elapsed = time.perf_counter() - start
+    request_cpu = time.thread_time() - cpu_start
+    if mode == "queue":
+        handler.flush(timeout=60)
+    total_elapsed = time.perf_counter() - start
+
+    stream.flush()
+    with open(path, encoding="utf-8") as f:
+        written = sum(1 for _ in f)
+    os.remove(path)
+    root.handlers = []
+    return {
+        "us_per_request": request_elapsed / requests * 1e6,
+        "cpu_us_per_request": request_cpu / requests * 1e6,
+        "total_s": total_elapsed,
+        "written": written,
+        "dropped": handler.stats()["dropped"] + handler.stats()["sampled_out"]
+        if mode == "queue"
+        else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--slow-write-us", type=float, default=100)
+    parser.add_argument("--queue-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    for sink in ("file", "slow"):
+        requests = args.requests if sink == "file" else args.requests // 10
+        print(f"{sink} sink, {requests} requests x 6 records")
+        for mode in ("sync", "queue"):
+            result = run(mode, sink, requests, args.slow_write_us, args.queue_size)
+            print(
+                "  {:6s} {:8.1f} us/request ({:6.1f} us cpu) on request thread, "
+                "all written in {:6.2f}s, {} lines, {} dropped".format(
+                    mode,
+                    result["us_per_request"],
+                    result["cpu_us_per_request"],
+                    result["total_s"],
+                    result["written"],
+                    result["dropped"],
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
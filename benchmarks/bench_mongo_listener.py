@@ -0,0 +1,77 @@
+"""MongoQueryLogger 每条命令的监听开销：格式化前置（优化前）vs 延迟格式化
+
+    python benchmarks/bench_mongo_listener.py
+
+不需要 mongod，使用构造的 CommandStartedEvent/CommandSucceededEvent 字段直接调用监听器。
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bson import ObjectId, SON  # noqa: E402
+from debug_toolbar.mongo_listener import global_request_data, MongoQueryLogger  # noqa: E402
+
+
+class Event(object):
+    def __init__(self, request_id, command):
+        self.request_id = request_id
+        self.command_name = next(iter(command))
+        self.command = command
+        self.database_name = "test"
+        self.duration_micros = 1200
+
+
+COMMANDS = {
+    "find": SON(
+        [
+            ("find", "task"),
+            ("filter", {"_id": "1", "_deleted": None}),
+            ("sort", SON([("create_time", -1)])),
+            ("limit", 1),
+        ]
+    ),
+    "insertMany(1000)": SON(
+        [
+            ("insert", "task"),
+            (
+                "documents",
+                [
+                    {"_id": ObjectId(), "name": f"task-{i}", "status": i % 5, "tags": ["a", "b"]}
+                    for i in range(1000)
+                ],
+            ),
+        ]
+    ),
+}
+
+
+def run(command, eager):
+    listener = MongoQueryLogger()
+    counter = iter(range(10 ** 9))
+
+    def once():
+        event = Event(next(counter), command)
+        listener.started(event)
+        listener.succeeded(event)
+        if eager:
+            # 优化前 succeeded 中会立即格式化语句
+            query = next(iter(global_request_data["mongo_queries"]))
+            query.sql
+            query.details
+
+    return once
+
+
+def main():
+    for name, command in COMMANDS.items():
+        number = 2000 if name == "find" else 20
+        print(name)
+        for label, eager in (("eager (before)", True), ("lazy (after)", False)):
+            cost = min(timeit.repeat(run(command, eager), number=number, repeat=5))
+            print("  {:16s} {:10.2f} us/command".format(label, cost / number * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""生产环境采样模式下 MongoQueryLogger 的每条命令开销
+
+    python benchmarks/bench_mongo_sampling.py
+
+目标：未被采样的命令开销 < 2us，1% 采样率下平均开销 < 3us（相对一次 mongo 往返的数百微秒可以忽略）。
+在请求上下文中以很高的命令速率（每个请求 20 条命令）调用监听器，不需要 mongod。
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bson import SON  # noqa: E402
+from flask import Flask  # noqa: E402
+from debug_toolbar.mongo_listener import MongoQueryLogger, QuerySampler  # noqa: E402
+
+COMMANDS_PER_REQUEST = 20
+TARGET_US = {0.0: 2.0, 0.01: 3.0}
+
+
+class Event(object):
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.command_name = "find"
+        self.command = SON([("find", "task"), ("filter", {"_id": "1", "_deleted": None})])
+        self.database_name = "test"
+        self.duration_micros = 800
+
+
+EVENTS = [Event(i) for i in range(COMMANDS_PER_REQUEST)]
+
+
+def run(listener, app, requests):
+    for _ in range(requests):
+        with app.test_request_context("/api/path1/path2/path3/test"):
+            for event in EVENTS:
+                listener.started(event)
+                listener.succeeded(event)
+
+
+def main():
+    app = Flask(__name__)
+    requests = 2000
+    number = requests * COMMANDS_PER_REQUEST
+
+    # 请求上下文本身的开销，从结果中扣除
+    def empty_requests():
+        for _ in range(requests):
+            with app.test_request_context("/api/path1/path2/path3/test"):
+                pass
+
+    context_cost = min(timeit.repeat(empty_requests, number=1, repeat=3))
+
+    failed = False
+    for label, sampler in (
+        ("sample rate 0", QuerySampler(rate=0.0)),
+        ("sample rate 0.01", QuerySampler(rate=0.01)),
+        ("full capture", None),
+    ):
+        listener = MongoQueryLogger(sampler=sampler)
+        cost = min(timeit.repeat(lambda: run(listener, app, requests), number=1, repeat=3))
+        per_command = max(cost - context_cost, 0) / number * 1e6
+        target = TARGET_US.get(sampler.rate) if sampler else None
+        ok = target is None or per_command <= target
+        failed = failed or not ok
+        print(
+            "{:18s} {:8.2f} us/command {}".format(
+                label, per_command, "" if target is None else f"(target {target}us: {'ok' if ok else 'FAIL'})"
+            )
+        )
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
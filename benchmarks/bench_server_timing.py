@@ -0,0 +1,68 @@
+"""Server-Timing 中间件每个请求增加的开销
+
+    python benchmarks/bench_server_timing.py
+
+在请求上下文中直接调用 Server-Timing 注册的 before_request、after_request（生成响应头）、
+teardown_request 钩子，加上每个请求 10 条 mongo 命令的监听器回调，得到每个请求增加的开销；
+另外单独给出监听器的每条命令开销。目标：每个请求（含 10 条 mongo 命令）< 5us。不需要 mongod。
+"""
+import configparser
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from flask import Flask, Response, g  # noqa: E402
+from utils.server_timing import register_server_timing  # noqa: E402
+
+COMMANDS_PER_REQUEST = 10
+NUMBER = 100000
+
+
+class Event(object):
+    duration_micros = 800
+
+
+def main():
+    app = Flask(__name__)
+
+    @app.before_request
+    def before_request():
+        g.start_time = time.time()
+
+    config = configparser.ConfigParser()
+    config.read_dict({"SERVER_TIMING": {"ENABLED": "true"}})
+    listener = register_server_timing(app, config)
+    event = Event()
+    before_timing = app.before_request_funcs[None][-1]
+    after_timing = app.after_request_funcs[None][-1]
+    teardown_timing = app.teardown_request_funcs[None][-1]
+    response = Response("{}")
+
+    def run_request():
+        before_timing()
+        for _ in range(COMMANDS_PER_REQUEST):
+            listener.succeeded(event)
+        after_timing(response)
+        teardown_timing(None)
+        # 去掉刚加上的响应头，复用同一个 response
+        response.headers._list.pop()
+
+    with app.test_request_context("/api/path1/path2/path3/test"):
+        app.preprocess_request()
+        per_request = min(timeit.repeat(run_request, number=NUMBER, repeat=5)) / NUMBER * 1e6
+        per_command = (
+            min(timeit.repeat(lambda: listener.succeeded(event), number=NUMBER, repeat=5))
+            / NUMBER
+            * 1e6
+        )
+    print(
+        f"Server-Timing overhead per request ({COMMANDS_PER_REQUEST} mongo commands): "
+        f"{per_request:.2f} us, listener {per_command:.3f} us/command"
+    )
+
+
+if __name__ == "__main__":
+    main()
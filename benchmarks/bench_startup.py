@@ -0,0 +1,123 @@
+"""启动耗时和单个 worker 的 RSS：遍历导入所有路由模块 vs 路由清单 vs 懒加载蓝图
+
+    python benchmarks/bench_startup.py --blueprints 300
+
+--blueprints 会在 apis/bp/benchgen 下临时生成指定数量的路由模块（结束后删除），模拟蓝图很多的项目。
+每种模式在独立子进程中 import app，记录耗时和 ru_maxrss，取多次运行的中位数：
+- walk：不使用路由清单，每次启动遍历 apis/bp 并导入所有 api*.py（原来的方式）
+- manifest：路由清单有效，不遍历目录，仍然导入所有路由模块
+- lazy：路由清单有效，不导入路由模块，第一次请求命中时再导入
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+GENERATED_DIR = os.path.join(ROOT, "apis", "bp", "benchgen")
+MANIFEST_PATH = ".route_manifest.bench.json"
+
+MODULE_TEMPLATE = '''from utils.url import get_bp
+from utils.wrapper import request_wrapper, get_param
+from models.task import Task
+
+bp = get_bp(__file__, __name__)
+'''
+
+ROUTE_TEMPLATE = '''
+
+@bp.route("/route{index}")
+@request_wrapper()
+def route{index}():
+    return Task.find_one(filter={{"_id": get_param("id")}}, return_json=True)
+'''
+
+CHILD_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+import utils.mongo_tool as mongo_tool
+mongo_tool.config.set("ROUTES", "MANIFEST", sys.argv[1])
+mongo_tool.config.set("ROUTES", "LAZY", sys.argv[2])
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "seconds": elapsed,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "routes": len(list(app.app.url_map.iter_rules())),
+    "modules": len(sys.modules),
+}))
+"""
+
+MODES = {
+    "walk": ("", "false"),
+    "manifest": (MANIFEST_PATH, "false"),
+    "lazy": (MANIFEST_PATH, "true"),
+}
+
+
+def generate_blueprints(count, routes_per_module):
+    for i in range(count):
+        module_dir = os.path.join(GENERATED_DIR, f"m{i}")
+        os.makedirs(module_dir)
+        with open(os.path.join(module_dir, "api.py"), "w", encoding="utf-8") as f:
+            f.write(MODULE_TEMPLATE)
+            for j in range(routes_per_module):
+                f.write(ROUTE_TEMPLATE.format(index=j))
+
+
+def run_child(mode, cwd):
+    env = dict(os.environ, PYTHONPATH=ROOT, FLASK_DEBUG="0")
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT, *MODES[mode]],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--blueprints", type=int, default=300, help="临时生成的路由模块数量")
+    parser.add_argument("--routes-per-module", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if os.path.exists(GENERATED_DIR):
+        sys.exit(f"{GENERATED_DIR} already exists")
+    manifest_file = os.path.join(ROOT, MANIFEST_PATH)
+    cwd = tempfile.mkdtemp()
+    try:
+        generate_blueprints(args.blueprints, args.routes_per_module)
+        # 第一次运行生成路由清单
+        run_child("manifest", cwd)
+        results = {}
+        for mode in MODES:
+            runs = [run_child(mode, cwd) for _ in range(args.repeat)]
+            results[mode] = {
+                "startup_ms": round(statistics.median(it["seconds"] for it in runs) * 1000, 1),
+                "rss_mb": round(statistics.median(it["rss_mb"] for it in runs), 1),
+                "url_rules": runs[0]["routes"],
+                "modules": runs[0]["modules"],
+            }
+            print(
+                "{:10s} startup {:8.1f} ms  rss {:7.1f} MB  url rules {:6d}  modules {:6d}".format(
+                    mode, *results[mode].values()
+                )
+            )
+        print(json.dumps({"blueprints": args.blueprints, "results": results}, indent=2))
+    finally:
+        shutil.rmtree(GENERATED_DIR, ignore_errors=True)
+        shutil.rmtree(cwd, ignore_errors=True)
+        if os.path.exists(manifest_file):
+            os.remove(manifest_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""MongoBase、序列化和 debug toolbar 热点函数的微基准，保存基线并在退化超过阈值时失败
+
+    # 使用进程内的 mongomock 替身（pip install mongomock），不需要 mongod
+    python benchmarks/microbench.py
+
+    # 使用本地 mongod，写入独立的 flask_debugger_bench 库，结束后删除
+    python benchmarks/microbench.py --mongo-uri mongodb://localhost:27017
+
+    # 保存基线；之后的运行与基线对比，ops/sec 下降或峰值内存上升超过 20% 时退出码为 1
+    python benchmarks/microbench.py --save-baseline benchmarks/baselines/microbench.json
+    python benchmarks/microbench.py --baseline benchmarks/baselines/microbench.json --threshold 0.2
+
+每个用例在 small / medium / large 三种文档结构下各跑一次，每次操作处理 BATCH_SIZE 条文档。
+ops/sec 取多轮中最快的一轮；peak_kb 为 tracemalloc 统计的单次操作峰值内存，
+retained_blocks 为单次操作后仍存活的内存块数（包含返回值），用来发现多余的拷贝和泄漏。
+基线与机器相关，只和同一台机器上的结果对比。
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bson import ObjectId, Decimal128, Int64, SON  # noqa: E402
+
+BATCH_SIZE = 100
+BENCH_DB_NAME = "flask_debugger_bench"
+
+
+def make_small(i):
+    return {"name": f"task-{i}", "status": i % 5, "score": i / 7, "enabled": bool(i % 2)}
+
+
+def make_medium(i):
+    now = datetime.datetime.now()
+    return {
+        "name": f"task-{i}",
+        "status": i % 5,
+        "score": i / 7,
+        "task_id": Int64(i),
+        "price": Decimal128("12.50"),
+        "owner_id": ObjectId(),
+        "tags": ["a", "b", "c"],
+        "owner": {"name": "owner", "login_time": now, "roles": ["admin", "dev"]},
+        "steps": [
+            {"step": j, "start_time": now, "end_time": None, "ok": True} for j in range(5)
+        ],
+        "start_time": now,
+    }
+
+
+def make_large(i):
+    doc = make_medium(i)
+    doc["history"] = [
+        {"version": j, "text": "x" * 64, "values": list(range(10)), "time": doc["start_time"]}
+        for j in range(200)
+    ]
+    return doc
+
+
+SHAPES = {"small": make_small, "medium": make_medium, "large": make_large}
+
+
+def get_db(mongo_uri):
+    """返回 mongo_tool 使用的数据库；没有 mongo_uri 时换成进程内的 mongomock"""
+    import utils.mongo_tool as mongo_tool
+
+    if mongo_uri:
+        mongo_tool.config["SERVER_INFO"]["DB_SERVER"] = mongo_uri
+        mongo_tool.config["SERVER_INFO"]["DB_NAME"] = BENCH_DB_NAME
+        return mongo_tool.db()
+
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit("没有 --mongo-uri 时需要 mongomock 作为进程内替身：pip install mongomock")
+    database = mongomock.MongoClient()[BENCH_DB_NAME]
+    mongo_tool.db = lambda: database
+    return database
+
+
+def make_cases(shape, docs, database):
+    """返回 {用例名: 无参函数}，每个函数处理 BATCH_SIZE 条 shape 结构的文档"""
+    from utils.mongo_tool import MongoBase
+    from utils.encode_util import CustomJSONEncoder
+    from utils.wrapper import get_json_result
+    from debug_toolbar.mongo_listener import (
+        pymongo_cmd_to_shell,
+        format_mongo_shell_generic,
+    )
+
+    collection_name = f"bench_{shape}"
+    model = type(f"Bench{shape.title()}", (MongoBase,), {"__collection__": collection_name})
+    database[collection_name].drop()
+    model.insert_many(docs)
+    found = model.find({})
+
+    insert_name = f"bench_{shape}_insert"
+    insert_model = type(
+        f"BenchInsert{shape.title()}", (MongoBase,), {"__collection__": insert_name}
+    )
+    insert_count = [0]
+
+    def insert_many():
+        insert_model.insert_many(docs)
+        insert_count[0] += 1
+        # 避免 collection 无限增长影响后面的轮次
+        if insert_count[0] % 50 == 0:
+            database[insert_name].drop()
+
+    find_command = SON(
+        [
+            ("find", collection_name),
+            ("filter", {"name": docs[0]["name"], "status": {"$in": [1, 2, 3]}}),
+            ("sort", SON([("start_time", -1)])),
+            ("limit", BATCH_SIZE),
+        ]
+    )
+    insert_command = SON([("insert", insert_name), ("ordered", True), ("documents", docs)])
+    find_shell = pymongo_cmd_to_shell(find_command)
+    insert_shell = pymongo_cmd_to_shell(insert_command)
+
+    return {
+        "MongoBase.find": lambda: model.find({}),
+        "MongoBase.insert_many": insert_many,
+        "get_json_result": lambda: get_json_result(found),
+        "CustomJSONEncoder": lambda: json.dumps(found, cls=CustomJSONEncoder),
+        "pymongo_cmd_to_shell.find": lambda: pymongo_cmd_to_shell(find_command),
+        "pymongo_cmd_to_shell.insert": lambda: pymongo_cmd_to_shell(insert_command),
+        "format_mongo_shell_generic.find": lambda: format_mongo_shell_generic(find_shell),
+        "format_mongo_shell_generic.insert": lambda: format_mongo_shell_generic(insert_shell),
+    }
+
+
+def measure_speed(func, min_time, rounds):
+    """先估算每轮的次数使其耗时约 min_time，取多轮中最快的 ops/sec"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 5 or number >= 1 << 20:
+            break
+        number *= 2
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return number / best
+
+
+def measure_memory(func):
+    """单次操作的 tracemalloc 峰值（KiB）和操作后仍存活的内存块数"""
+    func()
+    gc.collect()
+    gc.disable()
+    try:
+        blocks = sys.getallocatedblocks()
+        tracemalloc.start()
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        retained = sys.getallocatedblocks() - blocks
+        del result
+    finally:
+        gc.enable()
+    return peak / 1024, retained
+
+
+def run(args):
+    database = get_db(args.mongo_uri)
+    results = {}
+    try:
+        for shape, make_doc in SHAPES.items():
+            docs = [make_doc(i) for i in range(BATCH_SIZE)]
+            for name, func in make_cases(shape, docs, database).items():
+                key = f"{name}[{shape}]"
+                if args.filter and args.filter not in key:
+                    continue
+                ops = measure_speed(func, args.min_time, args.rounds)
+                peak_kb, retained = measure_memory(func)
+                results[key] = {
+                    "ops_per_sec": round(ops, 2),
+                    "peak_kb": round(peak_kb, 1),
+                    "retained_blocks": retained,
+                }
+                print(
+                    "{:45s} {:12.1f} ops/s  peak {:9.1f} KiB  retained {:7d} blocks".format(
+                        key, ops, peak_kb, retained
+                    )
+                )
+    finally:
+        if args.mongo_uri:
+            database.client.drop_database(BENCH_DB_NAME)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """返回超出阈值的退化项：ops/sec 下降或峰值内存上升超过 threshold"""
+    regressions = []
+    for key, current in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        speed_change = current["ops_per_sec"] / base["ops_per_sec"] - 1
+        memory_change = (
+            current["peak_kb"] / base["peak_kb"] - 1 if base["peak_kb"] else 0
+        )
+        if speed_change < -threshold:
+            regressions.append(f"{key}: ops/sec {speed_change:+.1%}")
+        if memory_change > threshold:
+            regressions.append(f"{key}: peak memory {memory_change:+.1%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo-uri", help="本地 mongod 地址，不设置时使用 mongomock")
+    parser.add_argument("--filter", help="只运行名称包含该字符串的用例")
+    parser.add_argument("--min-time", type=float, default=0.2, help="每轮的目标耗时（秒）")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--baseline", help="对比的基线 json 文件")
+    parser.add_argument("--threshold", type=float, default=0.2, help="允许的退化比例")
+    parser.add_argument("--save-baseline", help="把本次结果保存为基线")
+    parser.add_argument("-o", "--output", help="本次结果 json 文件")
+    args = parser.parse_args()
+
+    results = run(args)
+    report = {
+        "python": sys.version.split()[0],
+        "backend": "mongod" if args.mongo_uri else "mongomock",
+        "batch_size": BATCH_SIZE,
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "results": results,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("backend") != report["backend"]:
+            print(f"warning: baseline backend {baseline.get('backend')} != {report['backend']}")
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regressions beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+        print(f"\nno regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""回放录制的真实流量做压测，结果输出为 json，便于不同提交之间对比
+
+录制：在 config.properties 的 [TRAFFIC_CAPTURE] 中开启，请求会追加写入 traffic.jsonl
+
+    # 闭环模式：8 个并发，每个请求返回后立即发下一个，把录制的流量回放 3 遍
+    python benchmarks/replay_traffic.py replay traffic.jsonl --target http://localhost:3004 -c 8 --loops 3 -o before.json
+
+    # 固定速率（开环）模式：每秒 200 个请求，延迟从计划发出的时间算起，不会因为服务变慢而少发请求
+    python benchmarks/replay_traffic.py replay traffic.jsonl --target http://localhost:3004 --rate 200 -o after.json
+
+    # 对比两次结果
+    python benchmarks/replay_traffic.py compare before.json after.json
+
+请求带上 [TRAFFIC_CAPTURE] REPLAY_HEADER（默认 X-Replay）头，服务端只统计该请求执行的 mongo 语句数并在
+X-Mongo-Queries 响应头中返回，不会全量采集命令或写入请求历史（X-Debug-Trace 会，压测结果中会包含调试开销）。
+结果按录制时匹配到的路由规则（如 GET /api/task/<int:id>）汇总，旧的录制文件没有 route 时按 path 汇总。只依赖标准库
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+REPLAY_HEADER = "X-Replay"
+QUERY_COUNT_HEADER = "X-Mongo-Queries"
+
+
+def load_traffic(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def build_request(target, item):
+    url = target.rstrip("/") + item["path"]
+    if item.get("args"):
+        url += "?" + urllib.parse.urlencode(item["args"], doseq=True)
+    body = item.get("body") or None
+    req = urllib.request.Request(
+        url,
+        data=body.encode("utf-8") if body else None,
+        method=item["method"],
+        headers={REPLAY_HEADER: "1"},
+    )
+    if item.get("content_type"):
+        req.add_header("Content-Type", item["content_type"])
+    return req
+
+
+def send(target, item, timeout, scheduled_time):
+    """发送一个请求，返回 (route, status, 延迟 ms, mongo 语句数)；status 为 None 表示连接失败"""
+    route = f"{item['method']} {item.get('route') or item['path']}"
+    status = None
+    queries = None
+    try:
+        with urllib.request.urlopen(build_request(target, item), timeout=timeout) as resp:
+            resp.read()
+            status = resp.status
+            queries = resp.headers.get(QUERY_COUNT_HEADER)
+    except urllib.error.HTTPError as ex:
+        status = ex.code
+        queries = ex.headers.get(QUERY_COUNT_HEADER)
+    except Exception:
+        pass
+    latency = (time.perf_counter() - scheduled_time) * 1000
+    return route, status, latency, int(queries) if queries is not None else None
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(int(round(p / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return round(sorted_values[index], 3)
+
+
+def summarize(results, elapsed):
+    latencies = sorted(it[2] for it in results)
+    errors = sum(1 for it in results if it[1] is None or it[1] >= 500)
+    queries = [it[3] for it in results if it[3] is not None]
+    statuses = defaultdict(int)
+    for it in results:
+        statuses[str(it[1])] += 1
+    return {
+        "requests": len(results),
+        "errors": errors,
+        "error_rate": round(errors / len(results), 4) if results else 0,
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else None,
+            "p50": percentile(latencies, 50),
+            "p90": percentile(latencies, 90),
+            "p99": percentile(latencies, 99),
+            "max": round(latencies[-1], 3) if latencies else None,
+        },
+        "mongo_queries_per_request": round(sum(queries) / len(queries), 2) if queries else None,
+        "statuses": dict(statuses),
+    }
+
+
+def replay_closed_loop(target, items, concurrency, timeout):
+    """每个 worker 发完一个请求再取下一个"""
+    results = []
+    lock = threading.Lock()
+    position = iter(items)
+
+    def worker():
+        while True:
+            with lock:
+                item = next(position, None)
+            if item is None:
+                return
+            result = send(target, item, timeout, time.perf_counter())
+            with lock:
+                results.append(result)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def replay_fixed_rate(target, items, rate, concurrency, timeout):
+    """按固定速率发出请求，延迟从计划发出的时间算起，避免协同遗漏（coordinated omission）"""
+    start = time.perf_counter()
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i, item in enumerate(items):
+            scheduled_time = start + i / rate
+            delay = scheduled_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(send, target, item, timeout, scheduled_time))
+    return [future.result() for future in futures]
+
+
+def replay(args):
+    items = load_traffic(args.file) * args.loops
+    if args.limit:
+        items = items[: args.limit]
+    if not items:
+        sys.exit(f"no requests in {args.file}")
+
+    start = time.perf_counter()
+    if args.rate:
+        results = replay_fixed_rate(args.target, items, args.rate, args.concurrency, args.timeout)
+    else:
+        results = replay_closed_loop(args.target, items, args.concurrency, args.timeout)
+    elapsed = time.perf_counter() - start
+
+    by_route = defaultdict(list)
+    for result in results:
+        by_route[result[0]].append(result)
+    report = {
+        "target": args.target,
+        "traffic_file": args.file,
+        "mode": "fixed_rate" if args.rate else "closed_loop",
+        "rate": args.rate,
+        "concurrency": args.concurrency,
+        "started_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "duration_s": round(elapsed, 3),
+        **summarize(results, elapsed),
+        "routes": {
+            route: summarize(route_results, elapsed)
+            for route, route_results in sorted(by_route.items())
+        },
+    }
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+def compare(args):
+    """对比两次回放结果，输出整体和每个路由的 p50/p99、吞吐、错误率和语句数变化"""
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+
+    def metrics(report):
+        return {
+            "p50_ms": report["latency_ms"]["p50"],
+            "p99_ms": report["latency_ms"]["p99"],
+            "throughput_rps": report["throughput_rps"],
+            "error_rate": report["error_rate"],
+            "mongo_queries_per_request": report["mongo_queries_per_request"],
+        }
+
+    def diff(before, after):
+        result = {}
+        for key, value in after.items():
+            old = before.get(key)
+            change = None
+            if isinstance(old, (int, float)) and isinstance(value, (int, float)) and old:
+                change = round((value - old) / old * 100, 2)
+            result[key] = {"base": old, "current": value, "change_pct": change}
+        return result
+
+    report = {
+        "overall": diff(metrics(base), metrics(current)),
+        "routes": {
+            route: diff(metrics(base["routes"][route]), metrics(current["routes"][route]))
+            for route in sorted(set(base["routes"]) & set(current["routes"]))
+        },
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回放录制的流量并统计延迟、吞吐、错误率和 mongo 语句数")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    replay_parser = subparsers.add_parser("replay", help="回放 jsonl 流量文件")
+    replay_parser.add_argument("file", help="录制的 traffic.jsonl")
+    replay_parser.add_argument("--target", default="http://localhost:3004")
+    replay_parser.add_argument("-c", "--concurrency", type=int, default=8)
+    replay_parser.add_argument("--rate", type=float, default=0, help="每秒请求数，不设置时为闭环模式")
+    replay_parser.add_argument("--loops", type=int, default=1, help="流量文件重复回放的次数")
+    replay_parser.add_argument("--limit", type=int, default=0, help="最多回放的请求数")
+    replay_parser.add_argument("--timeout", type=float, default=30)
+    replay_parser.add_argument("-o", "--output", help="结果 json 文件")
+    replay_parser.set_defaults(func=replay)
+
+    compare_parser = subparsers.add_parser("compare", help="对比两次回放结果")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("current")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
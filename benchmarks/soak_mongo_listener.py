@@ -0,0 +1,94 @@
+"""MongoQueryLogger 浸泡测试：模拟数百万条命令（成功、失败、从未结束），RSS 应保持平稳
+
+    python benchmarks/soak_mongo_listener.py --commands 3000000
+
+不需要 mongod。RSS 增长超过 --max-growth-mb 时以非 0 状态码退出。
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bson import ObjectId, SON  # noqa: E402
+from debug_toolbar.mongo_listener import MongoQueryLogger  # noqa: E402
+
+
+class Event(object):
+    def __init__(self, request_id, command):
+        self.request_id = request_id
+        self.command_name = next(iter(command))
+        self.command = command
+        self.database_name = "test"
+        self.duration_micros = 800
+        self.failure = {"errmsg": "E11000 duplicate key error", "code": 11000}
+
+
+def get_rss_mb():
+    # 优先读取当前 RSS，非 Linux 使用峰值 RSS
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_command(i):
+    if i % 10 == 0:
+        return SON(
+            [
+                ("insert", "task"),
+                ("documents", [{"_id": ObjectId(), "name": f"task-{i}-{j}"} for j in range(200)]),
+            ]
+        )
+    return SON([("find", "task"), ("filter", {"_id": str(i), "_deleted": None})])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--commands", type=int, default=3000000)
+    parser.add_argument("--report-every", type=int, default=250000)
+    parser.add_argument("--max-growth-mb", type=float, default=20)
+    args = parser.parse_args()
+
+    listener = MongoQueryLogger()
+    start_time = time.time()
+    baseline = None
+    rss = get_rss_mb()
+    for i in range(args.commands):
+        event = Event(i, make_command(i))
+        listener.started(event)
+        if i % 100 == 1:
+            listener.failed(event)
+        elif i % 1000 == 2:
+            # 从未结束的命令（比如连接中断），只能依赖 max_pending 淘汰
+            pass
+        else:
+            listener.succeeded(event)
+
+        if (i + 1) % args.report_every == 0:
+            rss = get_rss_mb()
+            if baseline is None:
+                baseline = rss
+            print(
+                "{:>10d} commands  RSS {:8.1f} MB  pending {:6d}  {:6.0f} commands/s".format(
+                    i + 1,
+                    rss,
+                    len(listener.started_commands),
+                    (i + 1) / (time.time() - start_time),
+                )
+            )
+
+    growth = rss - (baseline or rss)
+    print(f"RSS growth after warm-up: {growth:.1f} MB")
+    if growth > args.max_growth_mb:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
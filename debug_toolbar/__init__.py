@@ -1,3 +1,10 @@
-from .dev_toolbar import DevToolbar
-
 __all__ = ["DevToolbar"]
+
+
+def __getattr__(name):
+    # DevToolbar 依赖 flask_debugtoolbar，只在开发环境用到时再导入，导入 debug_toolbar 的其他模块不会加载它
+    if name == "DevToolbar":
+        from .dev_toolbar import DevToolbar
+
+        return DevToolbar
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2,9 +2,8 @@ import flask_debugtoolbar
 from flask import request, make_response, render_template_string, g
 import time
 from collections import deque
-
-# 所有历史累积数据
-global_request_data = {"mongo_queries": deque(maxlen=200)}
+from debug_toolbar.query_analyzer import start_request_analysis
+from utils.server_timing import stop_timing
 
 
 class DevToolbar:
@@ -39,12 +38,15 @@ class DevToolbar:
 
             g.start_time = time.time()
             g.mongo_queries = deque(maxlen=50)
+            start_request_analysis()
 
         @app.after_request
         def after_request(response):
             if response.mimetype == "application/json" and (
                 request.full_path == "/?" or "_debug" in request.args
             ):
+                # 下面会对包装后的响应再执行一遍 after_request，Server-Timing 不计入渲染耗时
+                stop_timing()
                 html_wrapped_response = make_response(
                     render_template_string(
                         wrap_json,
@@ -57,4 +59,9 @@ class DevToolbar:
 
             return response
 
+        # History 面板分页查询接口
+        from debug_toolbar.history_api import bp as history_bp
+
+        app.register_blueprint(history_bp)
+
         flask_debugtoolbar.DebugToolbarExtension(app)
@@ -0,0 +1,108 @@
+from flask import Blueprint, request, jsonify
+
+from debug_toolbar.shared_store import get_store
+from debug_toolbar.panels.request_history_panel import REQUEST_HISTORY
+
+bp = Blueprint("debug_history", __name__, url_prefix="/_debug_toolbar_history")
+
+SUMMARY_KEYS = (
+    "id",
+    "method",
+    "path",
+    "status",
+    "duration",
+    "timestamp",
+    "saved_queries",
+    "query_count",
+    "findings",
+)
+
+
+def get_float_arg(name):
+    value = request.args.get(name)
+    return float(value) if value not in (None, "") else None
+
+
+def search_memory_history(
+    path, statuses, min_duration, max_duration, since, until, cursor, page_size
+):
+    """没有开启共享存储时在进程内的 REQUEST_HISTORY（从新到旧）中按相同条件查询"""
+    items = []
+    # 复制一份，遍历时其他线程写入 deque 会报错
+    for req in list(REQUEST_HISTORY):
+        if cursor and req["id"] >= cursor:
+            continue
+        if path and (
+            not req["path"].startswith(path) if path.startswith("/") else path not in req["path"]
+        ):
+            continue
+        if statuses and req["status"] not in statuses:
+            continue
+        if min_duration is not None and req["duration"] < min_duration:
+            continue
+        if max_duration is not None and req["duration"] > max_duration:
+            continue
+        if since and req["timestamp"] < since:
+            continue
+        if until and req["timestamp"] > until:
+            continue
+        item = {key: req.get(key) for key in SUMMARY_KEYS}
+        items.append(item)
+        if len(items) > page_size:
+            return items[:page_size], items[page_size - 1]["id"]
+    return items, None
+
+
+@bp.route("/requests")
+def search_requests():
+    """keyset 分页返回请求摘要，不包含 mongo 语句；cursor 为上一页返回的 next_cursor"""
+    path = request.args.get("path", "").strip()
+    statuses = [int(it) for it in request.args.get("status", "").split(",") if it.strip()]
+    cursor = request.args.get("cursor", type=int)
+    page_size = min(max(request.args.get("page_size", 50, type=int), 1), 500)
+    params = dict(
+        path=path,
+        statuses=statuses,
+        min_duration=get_float_arg("min_duration"),
+        max_duration=get_float_arg("max_duration"),
+        since=request.args.get("since"),
+        until=request.args.get("until"),
+        cursor=cursor,
+        page_size=page_size,
+    )
+
+    store = get_store()
+    if store:
+        items, next_cursor = store.search_requests(**params)
+    else:
+        items, next_cursor = search_memory_history(**params)
+    return jsonify({"next_cursor": next_cursor, "page_size": page_size, "items": items})
+
+
+@bp.route("/requests/<int:request_id>/queries")
+def get_request_queries(request_id):
+    """按需加载单个请求的 mongo 语句"""
+    store = get_store()
+    if store:
+        queries = store.get_request_queries(request_id)
+    else:
+        queries = next(
+            (req["mongo_queries"] for req in REQUEST_HISTORY if req["id"] == request_id),
+            None,
+        )
+    if queries is None:
+        return jsonify({"error": True, "msg": f"request {request_id} not found"}), 404
+
+    return jsonify(
+        [
+            {
+                "command": query.command,
+                "collection": query.collection,
+                "duration": query.duration,
+                "error": query.error,
+                "sql": query.sql,
+                "details": query.details,
+            }
+            for query in queries
+        ]
+    )
@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+
+from bson import SON
+
+from debug_toolbar.query_stats import query_stats
+from utils.mongo_tool import db
+
+# 等值匹配的操作符，其余比较操作符视为范围查询
+EQUALITY_OPERATORS = ("$eq", "$in")
+# 命令中与查询无关、重放 explain 时需要去掉的字段
+SESSION_FIELDS = ("lsid", "txnNumber", "autocommit", "startTransaction")
+
+# (生成时间, limit, 结果)，重放 explain 的开销较大，ttl 内的访问直接返回上次的结果
+__advice_cache = None
+__advice_lock = threading.Lock()
+
+
+def get_plan_stages(plan):
+    """展开 winningPlan 中所有的 stage"""
+    stages = []
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        if "stage" in node:
+            stages.append(node["stage"])
+        if "inputStage" in node:
+            stack.append(node["inputStage"])
+        stack.extend(node.get("inputStages", []))
+        # 分片集群
+        stack.extend(node.get("shards", []))
+        if "winningPlan" in node:
+            stack.append(node["winningPlan"])
+    return stages
+
+
+def get_winning_plan(explain):
+    if "queryPlanner" in explain:
+        return explain["queryPlanner"].get("winningPlan", {})
+    # aggregate 的 explain 结果在第一个 $cursor 阶段中
+    for stage in explain.get("stages", []):
+        if "$cursor" in stage:
+            return stage["$cursor"].get("queryPlanner", {}).get("winningPlan", {})
+    return {}
+
+
+def get_query_filter(command_name, command):
+    if command_name == "find":
+        return command.get("filter", {})
+    if command_name in ("count", "distinct"):
+        return command.get("query", {})
+    if command_name == "aggregate":
+        pipeline = command.get("pipeline", [])
+        if pipeline and "$match" in pipeline[0]:
+            return pipeline[0]["$match"]
+    return {}
+
+
+def get_query_sort(command_name, command):
+    if command_name == "find":
+        return list(dict(command.get("sort") or {}).items())
+    if command_name == "aggregate":
+        for stage in command.get("pipeline", []):
+            if "$sort" in stage:
+                return list(dict(stage["$sort"]).items())
+    return []
+
+
+def suggest_index(filter, sort):
+    """按 ESR（等值 - 排序 - 范围）规则给出复合索引建议"""
+    equality = []
+    ranges = []
+    for key, value in filter.items():
+        if key.startswith("$"):
+            # $and/$or 等逻辑操作符无法简单推断，跳过
+            continue
+        if isinstance(value, dict) and any(op.startswith("$") for op in value):
+            if all(op in EQUALITY_OPERATORS for op in value):
+                equality.append(key)
+            else:
+                ranges.append(key)
+        else:
+            equality.append(key)
+
+    keys = [(key, 1) for key in equality]
+    used = set(equality)
+    for key, direction in sort:
+        if key not in used:
+            keys.append((key, direction))
+            used.add(key)
+    keys.extend((key, 1) for key in ranges if key not in used)
+    return keys
+
+
+def explain_command(command_name, command, verbosity="queryPlanner"):
+    cmd = SON(
+        (key, value)
+        for key, value in command.items()
+        if not key.startswith("$") and key not in SESSION_FIELDS
+    )
+    return db().command(SON([("explain", cmd), ("verbosity", verbosity)]))
+
+
+def advise_indexes(limit=50):
+    """
+    重放查询统计中按总耗时排在前面的 shape 的样例命令，通过 explain 找出 COLLSCAN，
+    并给出复合索引建议，结果按总耗时倒序
+    """
+    report = []
+    for item, sample in query_stats.samples()[:limit]:
+        command_name = next(iter(sample))
+        advice = dict(item, stages=[], collscan=False, suggested_index=None, error="")
+        try:
+            explain = explain_command(command_name, sample)
+            advice["stages"] = get_plan_stages(get_winning_plan(explain))
+        except Exception as ex:
+            logging.warning("explain %s failed: %r", item["shape"], ex)
+            advice["error"] = repr(ex)
+        if "COLLSCAN" in advice["stages"]:
+            advice["collscan"] = True
+            advice["suggested_index"] = suggest_index(
+                get_query_filter(command_name, sample),
+                get_query_sort(command_name, sample),
+            )
+        report.append(advice)
+    return report
+
+
+def get_index_advice(limit=50, ttl=60):
+    """带缓存的 advise_indexes，同一时间只有一个线程执行 explain，其他线程等待后使用它的结果"""
+    global __advice_cache
+    with __advice_lock:
+        cache = __advice_cache
+        if cache is not None and cache[1] == limit and time.time() - cache[0] < ttl:
+            return cache[2]
+        report = advise_indexes(limit)
+        __advice_cache = (time.time(), limit, report)
+        return report
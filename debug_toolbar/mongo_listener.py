@@ -0,0 +1,452 @@
+"""
+mongo 命令监听：记录执行的语句供 MongoDB 面板、/_mongo/queries 和共享存储使用。
+不依赖 flask_debugtoolbar，生产环境（非 debug）启动时只导入这个模块
+"""
+from flask import has_request_context, request, g
+from pymongo import monitoring
+import time
+import json
+import random
+from collections import OrderedDict
+import bson
+from bson import SON
+import os
+import re
+from debug_toolbar.ring_buffer import RingBuffer
+from debug_toolbar.shared_store import get_store
+from debug_toolbar.query_analyzer import is_strict_mode
+
+# 所有历史累积数据，生产环境采样模式下也会写入，使用无锁的环形缓冲区
+global_request_data = {"mongo_queries": RingBuffer(maxlen=200)}
+
+
+def format_mongo_shell_generic(shell: str, indent: int = 2) -> str:
+    """
+    通用 Mongo Shell/SQL 格式化器。
+    适用于 db.xxx.xxx(...) 语句，支持链式调用，支持嵌套括号和换行缩进。
+    """
+    s = shell.strip()
+
+    # 1. 用正则分割每个链式调用（.func(args)）
+    parts = []
+    bracket = 0
+    last = 0
+    for i, c in enumerate(s):
+        if c == "(":
+            bracket += 1
+        elif c == ")":
+            bracket -= 1
+        elif c == "." and bracket == 0 and i > 0:
+            parts.append(s[last:i])
+            last = i
+    parts.append(s[last:])
+
+    # 2. 格式化每段 .func(args)
+    formatted = ""
+    first = True
+    for p in parts:
+        m = re.match(r"^(\w+\.)?(\w+)\((.*)\)$", p.strip(), re.DOTALL)
+        if m:
+            prefix, func, args = m.groups()
+            # 尝试智能分割入参（按逗号分隔且支持嵌套对象/数组）
+            arg_list = []
+            depth = 0
+            start = 0
+            for i, c in enumerate(args):
+                if c in "{[(":
+                    depth += 1
+                elif c in "}])":
+                    depth -= 1
+                elif c == "," and depth == 0:
+                    arg_list.append(args[start:i].strip())
+                    start = i + 1
+            if args[start:].strip():
+                arg_list.append(args[start:].strip())
+            # 多参数多行缩进
+            arg_fmt = ",\n".join(" " * indent + a for a in arg_list)
+            line = f"{('.' if not first else '')}{func}(\n{arg_fmt}\n)"
+        else:
+            # 不规则部分原样输出
+            line = p.strip()
+        formatted += ("" if first else "\n") + line
+        first = False
+
+    return formatted
+
+
+def bson_to_shell(val):
+    """简易 BSON/SON/字典/列表转Mongo shell字符串。"""
+    # 你可以用更健壮的 json_util，但简单情况直接 json.dumps
+    # 注意 _id/ObjectId/Date 等类型复杂场景可引入 bson.json_util
+    if isinstance(val, SON):
+        val = dict(val)
+    return json.dumps(val, ensure_ascii=False, default=str, indent=2)
+
+
+def pymongo_cmd_to_shell(cmd):
+    """
+    cmd: dict or SON from pymongo monitoring CommandListener
+    return: mongo shell string
+    """
+    d = dict(cmd)
+    if "find" in d:
+        # 查询
+        collection = d["find"]
+        filter_ = d.get("filter", d.get("query", {}))
+        proj = d.get("projection")
+        shell = f"db.{collection}.find({bson_to_shell(filter_)}"
+        if proj:
+            shell += f", {bson_to_shell(proj)}"
+        shell += ")"
+        if "sort" in d:
+            shell += f".sort({bson_to_shell(dict(d['sort']))})"
+        if "limit" in d:
+            shell += f".limit({d['limit']})"
+        if "skip" in d:
+            shell += f".skip({d['skip']})"
+        return shell
+
+    elif "insert" in d:
+        # 批量插入
+        collection = d["insert"]
+        docs = d.get("documents", [])
+        if len(docs) == 1:
+            return f"db.{collection}.insert({bson_to_shell(docs[0])})"
+        else:
+            return f"db.{collection}.insertMany({bson_to_shell(docs)})"
+
+    elif "update" in d:
+        # 批量或单条更新
+        collection = d["update"]
+        updates = d.get("updates", [])
+        shells = []
+        for upd in updates:
+            q = upd.get("q", {})
+            u = upd.get("u", {})
+            multi = upd.get("multi", False)
+            upsert = upd.get("upsert", False)
+            opt = {}
+            if upsert:
+                opt["upsert"] = True
+            if multi:
+                call = "updateMany"
+            else:
+                call = "updateOne"
+            opt_str = f", {bson_to_shell(opt)}" if opt else ""
+            shells.append(
+                f"db.{collection}.{call}({bson_to_shell(q)}, {bson_to_shell(u)}{opt_str})"
+            )
+        return ";\n".join(shells)
+
+    elif "delete" in d:
+        # 批量或单条删除
+        collection = d["delete"]
+        deletes = d.get("deletes", [])
+        shells = []
+        for dele in deletes:
+            q = dele.get("q", {})
+            limit = dele.get("limit", 0)
+            if limit == 1:
+                call = "deleteOne"
+            else:
+                call = "deleteMany"
+            shells.append(f"db.{collection}.{call}({bson_to_shell(q)})")
+        return ";\n".join(shells)
+
+    elif "aggregate" in d:
+        # 聚合
+        collection = d["aggregate"]
+        pipeline = d.get("pipeline", [])
+        opt = {}
+        if d.get("allowDiskUse"):
+            opt["allowDiskUse"] = d["allowDiskUse"]
+        opt_str = f", {bson_to_shell(opt)}" if opt else ""
+        return f"db.{collection}.aggregate({bson_to_shell(pipeline)}{opt_str})"
+
+    elif "count" in d:
+        # 计数
+        collection = d["count"]
+        query = d.get("query", {})
+        return f"db.{collection}.count({bson_to_shell(query)})"
+
+    elif "distinct" in d:
+        # 去重
+        collection = d["distinct"]
+        key = d.get("key")
+        query = d.get("query", {})
+        return f'db.{collection}.distinct("{key}", {bson_to_shell(query)})'
+
+    elif "createIndexes" in d:
+        # 索引
+        collection = d["createIndexes"]
+        indexes = d.get("indexes", [])
+        # 只演示第一个
+        if indexes:
+            keys = indexes[0].get("key", {})
+            name = indexes[0].get("name", "")
+            return f'db.{collection}.createIndex({bson_to_shell(keys)}, {{name: "{name}"}})'
+        else:
+            return "createIndexes 未识别"
+
+    # 你可以继续扩展如 drop/dropIndexes/renameCollection...
+    return f"未支持命令: {d}"
+
+
+class MongoQuery(object):
+    """
+    一条 mongo 命令记录，只保存原始命令的引用，
+    sql/details 在面板或模板渲染时才格式化，并缓存格式化结果
+    """
+
+    __slots__ = (
+        "command",
+        "collection",
+        "duration",
+        "timestamp",
+        "path",
+        "raw_command",
+        "error",
+        "_sql",
+        "_details",
+    )
+
+    def __init__(
+        self, command, collection, duration, timestamp, path, raw_command, error=""
+    ):
+        self.command = command
+        self.collection = collection
+        self.duration = duration
+        self.timestamp = timestamp
+        self.path = path
+        self.raw_command = raw_command
+        self.error = error
+        self._sql = None
+        self._details = None
+
+    @property
+    def sql(self):
+        if self._sql is None:
+            self._sql = format_mongo_shell_generic(pymongo_cmd_to_shell(self.raw_command))
+        return self._sql
+
+    @property
+    def details(self):
+        if self._details is None:
+            self._details = bson_to_shell(self.raw_command)
+        return self._details
+
+    def __getitem__(self, key):
+        # 兼容原来 dict 形式的访问
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+
+# 批量写入命令中携带文档的字段
+PAYLOAD_FIELDS = ("documents", "updates", "deletes")
+# 不超过该条数的批量命令不计算大小直接保留，绝大多数命令（find、单条写入、小批量）不需要编码
+PAYLOAD_CHECK_ITEMS = 16
+# pymongo 生成命令时这些字段直接引用调用方的对象（比如 find 的 filter），记录时浅拷贝一层，
+# 调用方在查询之后修改自己的 filter/update，查看时不会显示修改后的值；更深层的嵌套对象仍是引用
+CALLER_FIELDS = ("filter", "query", "update", "sort", "projection", "pipeline")
+STATEMENT_FIELDS = ("q", "u")
+
+
+def copy_caller_fields(command):
+    """返回浅拷贝了调用方字段的新命令，不修改 pymongo 将要发送的命令对象。用 dict 拷贝，SON 的构造很慢"""
+    command = dict(command)
+    for field in CALLER_FIELDS:
+        value = command.get(field)
+        if isinstance(value, (dict, list)):
+            command[field] = value.copy()
+    for field in ("updates", "deletes"):
+        items = command.get(field)
+        if isinstance(items, list):
+            command[field] = [
+                {
+                    k: v.copy() if k in STATEMENT_FIELDS and isinstance(v, (dict, list)) else v
+                    for k, v in item.items()
+                }
+                if isinstance(item, dict)
+                else item
+                for item in items
+            ]
+    return command
+
+
+def limit_command_payload(command, max_bytes):
+    """
+    insertMany 等命令只保留前面约 max_bytes 的文档，避免长时间持有大批量数据，
+    被截断时在命令中记录原始条数。超过 PAYLOAD_CHECK_ITEMS 条时才按第一条文档的大小估算条数，不逐条编码
+    """
+    for field in PAYLOAD_FIELDS:
+        items = command.get(field)
+        if not isinstance(items, list) or len(items) <= PAYLOAD_CHECK_ITEMS:
+            continue
+        count = max(1, max_bytes // max(len(bson.encode(items[0])), 1))
+        if count < len(items):
+            command = SON(command)
+            command[field] = items[:count]
+            command["_truncated"] = f"{count}/{len(items)} {field}"
+    return command
+
+
+class QuerySampler(object):
+    """
+    生产环境的采样策略，按请求决定是否采集该请求内的所有 mongo 命令：
+    带 _debug 参数或 trace_header 请求头时必定采集，否则按路由的采样率（默认 rate）随机采集，
+    请求外的命令（定时任务等）按 rate 逐条采样
+    """
+
+    def __init__(self, rate=0.01, route_rates=None, trace_header="X-Debug-Trace"):
+        self.rate = rate
+        self.route_rates = route_rates or {}
+        self.trace_header = trace_header
+
+    def should_capture(self):
+        # 每条命令都会调用，只通过 LocalProxy 取一次请求对象，采样结果缓存在该请求对象上
+        if not has_request_context():
+            return random.random() < self.rate
+
+        req = request._get_current_object()
+        capture = getattr(req, "mongo_capture", None)
+        if capture is None:
+            if "_debug" in req.args or self.trace_header in req.headers:
+                capture = True
+            else:
+                route = req.url_rule.rule if req.url_rule else req.path
+                capture = random.random() < self.route_rates.get(route, self.rate)
+            req.mongo_capture = capture
+        return capture
+
+
+# ================= MongoDB 查询监听器 =================
+class MongoQueryLogger(monitoring.CommandListener):
+    def __init__(self, max_pending=10000, max_command_bytes=16 * 1024, sampler=None):
+        # 已开始未结束的命令，结束时移除；超过 max_pending 时丢弃最早的，防止泄漏。
+        # OrderedDict 的单个操作在 CPython 中是原子的，这里不加锁
+        self.started_commands = OrderedDict()
+        self.max_pending = max_pending
+        self.max_command_bytes = max_command_bytes
+        # 为 None 时全部采集（开发环境）
+        self.sampler = sampler
+
+    def started(self, event):
+        if self.sampler and not self.sampler.should_capture():
+            return
+        col = (
+            event.command.get(event.command_name)
+            if isinstance(event.command, dict)
+            else None
+        )
+        info = {
+            "command_name": event.command_name,
+            "command": copy_caller_fields(
+                limit_command_payload(event.command, self.max_command_bytes)
+            ),
+            "collection": col,
+            "database": event.database_name,
+            "start_time": time.time(),
+        }
+        self.started_commands[event.request_id] = info
+        while len(self.started_commands) > self.max_pending:
+            try:
+                self.started_commands.popitem(last=False)
+            except KeyError:
+                break
+
+    def succeeded(self, event):
+        info = self.started_commands.pop(event.request_id, None)
+        if info is not None:
+            self._record(event, info)
+
+    def failed(self, event):
+        info = self.started_commands.pop(event.request_id, None)
+        if info is not None:
+            self._record(event, info, error=str(event.failure))
+
+    def _record(self, event, info, error=""):
+        # 只保存原始命令的引用，语句在查看时再格式化
+        query_data = MongoQuery(
+            command=event.command_name,
+            collection=info.get("collection", ""),
+            duration=event.duration_micros / 1000,  # 转为毫秒
+            timestamp=time.time(),
+            path=request.path if has_request_context() else "",
+            raw_command=info.get("command", {}),
+            error=error,
+        )
+
+        # 添加到全局请求历史
+        if "mongo_queries" in global_request_data:
+            global_request_data["mongo_queries"].appendleft(query_data)
+        store = get_store()
+        if store:
+            store.append_query(query_data)
+
+        # 如果没有请求上下文，直接返回
+        if not has_request_context():
+            return
+
+        # 单个请求的 N+1 / 重复语句分析
+        analyzer = g.get("query_analyzer")
+        if analyzer is not None:
+            analyzer.add(query_data)
+
+        if "_debug" not in request.args:
+            return
+
+        # 添加到单个请求
+        if hasattr(g, "mongo_queries"):
+            g.mongo_queries.append(query_data)
+
+
+def is_flask_debug():
+    # 1. 环境变量
+    if os.environ.get("FLASK_DEBUG") == "1":
+        return True
+    # 2. Flask <=2.2 的 FLASK_ENV
+    if os.environ.get("FLASK_ENV") == "development":
+        return True
+    # 3. 否则没法判断
+    return False
+
+
+def parse_route_rates(value):
+    """"/api/a:0.1,/api/b:1" -> {"/api/a": 0.1, "/api/b": 1.0}"""
+    rates = {}
+    for item in value.split(","):
+        if ":" in item:
+            route, rate = item.rsplit(":", 1)
+            rates[route.strip()] = float(rate)
+    return rates
+
+
+def get_sampler(config, section="MONGO_CAPTURE"):
+    """生产环境开启了采样模式时返回 QuerySampler，否则返回 None"""
+    if config is None or config.get(section, "MODE", fallback="off") != "sample":
+        return None
+    return QuerySampler(
+        rate=config.getfloat(section, "SAMPLE_RATE", fallback=0.01),
+        route_rates=parse_route_rates(config.get(section, "ROUTE_SAMPLE_RATES", fallback="")),
+        trace_header=config.get(section, "TRACE_HEADER", fallback="X-Debug-Trace"),
+    )
+
+
+def register_mongo_listener(max_command_bytes=16 * 1024, config=None):
+    """
+    注册MongoDB查询监听器，max_command_bytes 为单条命令中批量文档保留的字节数。
+    开发环境和开启了严格模式（测试）时全部采集，生产环境只有 config 中开启了采样模式才注册
+    """
+    sampler = None
+    if not is_flask_debug() and not is_strict_mode(config):
+        sampler = get_sampler(config)
+        if sampler is None:
+            return None
+    listener = MongoQueryLogger(max_command_bytes=max_command_bytes, sampler=sampler)
+    monitoring.register(listener)
+    return listener
@@ -1,4 +1,11 @@
-from .mongo_debug_panel import MongoDebugPanel, register_mongo_listener
+from debug_toolbar.mongo_listener import register_mongo_listener
+from .mongo_debug_panel import MongoDebugPanel
 from .request_history_panel import RequestHistoryPanel
+from .query_stats_panel import QueryStatsPanel
 
-__all__ = ["MongoDebugPanel", "RequestHistoryPanel", "register_mongo_listener"]
+__all__ = [
+    "MongoDebugPanel",
+    "RequestHistoryPanel",
+    "QueryStatsPanel",
+    "register_mongo_listener",
+]
@@ -0,0 +1,27 @@
+from flask_debugtoolbar.panels import DebugPanel
+from flask import render_template
+from debug_toolbar.query_stats import query_stats
+
+
+class QueryStatsPanel(DebugPanel):
+    """按查询 shape 聚合的 MongoDB 统计面板"""
+
+    name = "QueryStats"
+    has_content = True
+
+    def nav_title(self):
+        return "Query Stats"
+
+    def nav_subtitle(self):
+        return f"{len(query_stats.snapshot())} shapes"
+
+    def title(self):
+        return "MongoDB 查询 shape 统计（按总耗时排序）"
+
+    def url(self):
+        return ""
+
+    def content(self):
+        context = self.context.copy()
+        context.update({"stats": query_stats.snapshot()})
+        return render_template("query_stats_panel.html", **context)
@@ -1,12 +1,18 @@
 from flask_debugtoolbar.panels import DebugPanel
 from collections import deque
 from datetime import datetime
+import itertools
 import time
 from flask import render_template, g
+from utils import identity_map
+from debug_toolbar.shared_store import get_store
+from debug_toolbar.query_analyzer import get_request_analyzer
 
 
 # 存储历史请求 (内存中)
 REQUEST_HISTORY = deque(maxlen=50)  # 限制最大记录数
+# 进程内历史的请求 id，开启共享存储时使用数据库中的 id
+REQUEST_IDS = itertools.count(1)
 
 
 class RequestHistoryPanel(DebugPanel):
@@ -19,7 +25,9 @@ class RequestHistoryPanel(DebugPanel):
         return "History"
 
     def nav_subtitle(self):
-        return f"{len(REQUEST_HISTORY)} requests"
+        store = get_store()
+        count = store.count_requests() if store else len(REQUEST_HISTORY)
+        return f"{count} requests"
 
     def title(self):
         return "携带参数 ?_debug 的请求历史"
@@ -35,24 +43,30 @@ class RequestHistoryPanel(DebugPanel):
 
         # 记录请求数据
         duration = (time.time() - g.start_time) * 1000  # 毫秒
+        mongo_queries = g.mongo_queries if hasattr(g, "mongo_queries") else []
+        # g.mongo_queries 最多保留 50 条，语句数和分析结果以分析器为准
+        analyzer = get_request_analyzer()
         request_data = {
-            "id": len(REQUEST_HISTORY) + 1,
+            "id": next(REQUEST_IDS),
             "method": request.method,
             "path": request.path,
             "status": response.status_code,
             "duration": duration,
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "mongo_queries": g.mongo_queries if hasattr(g, "mongo_queries") else [],
+            "mongo_queries": mongo_queries,
+            "query_count": analyzer.count if analyzer else len(mongo_queries),
+            "findings": analyzer.findings() if analyzer else [],
+            # identity map 省掉的查询次数
+            "saved_queries": identity_map.get_hits(),
         }
 
         # 添加到历史队列
         REQUEST_HISTORY.appendleft(request_data)
+        store = get_store()
+        if store:
+            store.append_request(request_data)
 
     def content(self):
+        # 列表和详情都由页面通过 debug_toolbar.history_api 分页加载
         context = self.context.copy()
-        context.update(
-            {
-                "requests": REQUEST_HISTORY,
-            }
-        )
         return render_template("history_panel.html", **context)
@@ -0,0 +1,191 @@
+import logging
+
+from bson import json_util
+from flask import g, request
+
+from debug_toolbar.query_stats import EXPLAINABLE_COMMANDS, get_command_shape
+
+# 每次请求都会变化、不影响查询结果的字段，判断完全重复的语句时忽略
+VOLATILE_FIELDS = ("lsid", "$clusterTime", "txnNumber", "$readPreference")
+
+# 分页读取游标，重复出现是正常的
+IGNORED_COMMANDS = ("getMore", "killCursors", "endSessions")
+
+# 单个请求的分析配置，由 register_query_analysis 从 config.properties 读取
+analysis_config = {
+    "repeat_threshold": 5,
+    "query_budget": 0,
+    "strict_mode": "off",
+}
+
+
+class QueryBudgetExceeded(Exception):
+    """严格模式下请求的 mongo 语句数超出预算"""
+
+
+class RequestQueryAnalyzer(object):
+    """
+    单个请求内的 mongo 语句分析，语句结束时逐条累加，不依赖 g.mongo_queries 保留的条数：
+    1. 同一 shape 重复超过 repeat_threshold 次，通常是循环中逐条查询（N+1）
+    2. 参数完全相同的读语句重复执行
+    3. 不带 limit 的 find
+    浪费时间按「合并成一条语句后可以省掉的耗时」估算，不带 limit 的 find 取全部耗时
+    """
+
+    def __init__(self, repeat_threshold=5):
+        self.repeat_threshold = repeat_threshold
+        self.count = 0
+        self.total_duration = 0.0
+        # key -> {"collection", "command", "shape", "count", "duration", "sample"}
+        self.shapes = {}
+        self.duplicates = {}
+        self.unbounded = {}
+
+    def add(self, query):
+        self.count += 1
+        self.total_duration += query.duration
+        if query.command in IGNORED_COMMANDS:
+            return
+
+        command = query.raw_command
+        collection, shape = get_command_shape(query.command, command)
+        self._add_group(self.shapes, (collection, shape), query, shape)
+
+        if query.command in EXPLAINABLE_COMMANDS:
+            key = json_util.dumps(
+                {k: v for k, v in command.items() if k not in VOLATILE_FIELDS}
+            )
+            self._add_group(self.duplicates, key, query, shape)
+
+        if (
+            query.command == "find"
+            and not command.get("limit")
+            and not command.get("singleBatch")
+        ):
+            self._add_group(self.unbounded, (collection, shape), query, shape)
+
+    @staticmethod
+    def _add_group(groups, key, query, shape):
+        group = groups.get(key)
+        if group is None:
+            groups[key] = {
+                "collection": query.collection,
+                "command": query.command,
+                "shape": shape,
+                "count": 1,
+                "duration": query.duration,
+                "sample": query,
+            }
+        else:
+            group["count"] += 1
+            group["duration"] += query.duration
+
+    @staticmethod
+    def _finding(kind, group, wasted_time, message):
+        return {
+            "type": kind,
+            "collection": group["collection"],
+            "command": group["command"],
+            "shape": group["shape"],
+            "count": group["count"],
+            "duration": round(group["duration"], 3),
+            "wasted_time": round(wasted_time, 3),
+            "message": message,
+            "sample": group["sample"].sql,
+        }
+
+    def findings(self):
+        """返回所有发现，按浪费时间倒序"""
+        result = []
+        for group in self.shapes.values():
+            if group["count"] > self.repeat_threshold:
+                result.append(
+                    self._finding(
+                        "n_plus_one",
+                        group,
+                        group["duration"] * (group["count"] - 1) / group["count"],
+                        f"相同结构的语句执行了 {group['count']} 次，考虑用 $in / find_by_keys / insert_many 合并",
+                    )
+                )
+        for group in self.duplicates.values():
+            if group["count"] > 1:
+                result.append(
+                    self._finding(
+                        "duplicate",
+                        group,
+                        group["duration"] * (group["count"] - 1) / group["count"],
+                        f"参数完全相同的语句执行了 {group['count']} 次，考虑复用结果或开启 identity map",
+                    )
+                )
+        for group in self.unbounded.values():
+            result.append(
+                self._finding(
+                    "unbounded_find",
+                    group,
+                    group["duration"],
+                    "find 没有 limit，数据量增长后耗时和内存不可控，考虑分页（find_page / iter_find）",
+                )
+            )
+        result.sort(key=lambda it: it["wasted_time"], reverse=True)
+        return result
+
+
+def start_request_analysis():
+    """在请求开始时创建分析器，MongoQueryLogger 记录语句时写入"""
+    if "query_analyzer" not in g:
+        g.query_analyzer = RequestQueryAnalyzer(analysis_config["repeat_threshold"])
+    return g.query_analyzer
+
+
+def get_request_analyzer():
+    return g.get("query_analyzer")
+
+
+def check_query_budget(analyzer, path):
+    """严格模式下检查请求的语句数，log 记录警告，raise 抛出 QueryBudgetExceeded"""
+    budget = analysis_config["query_budget"]
+    mode = analysis_config["strict_mode"]
+    if mode == "off" or budget <= 0 or analyzer.count <= budget:
+        return
+
+    findings = "; ".join(
+        f"{it['type']} {it['collection']} x{it['count']}" for it in analyzer.findings()
+    )
+    message = (
+        f"{path} executed {analyzer.count} mongo queries, budget {budget}"
+        + (f" ({findings})" if findings else "")
+    )
+    if mode == "raise":
+        raise QueryBudgetExceeded(message)
+    logging.warning(message)
+
+
+def is_strict_mode(config, section="QUERY_ANALYSIS"):
+    return config is not None and config.get(section, "STRICT_MODE", fallback="off") != "off"
+
+
+def register_query_analysis(app, config, section="QUERY_ANALYSIS"):
+    """
+    读取分析配置；开启严格模式时所有请求都会分析并检查语句预算，
+    用于测试中发现新增的 N+1 查询，需要 MongoQueryLogger 全量采集
+    """
+    analysis_config.update(
+        {
+            "repeat_threshold": config.getint(section, "REPEAT_THRESHOLD", fallback=5),
+            "query_budget": config.getint(section, "QUERY_BUDGET", fallback=0),
+            "strict_mode": config.get(section, "STRICT_MODE", fallback="off"),
+        }
+    )
+    if not is_strict_mode(config, section):
+        return
+
+    @app.before_request
+    def before_request_analysis():
+        start_request_analysis()
+
+    @app.after_request
+    def after_request_analysis(response):
+        analyzer = get_request_analyzer()
+        if analyzer is not None:
+            check_query_budget(analyzer, request.path)
+        return response
@@ -0,0 +1,236 @@
+import json
+import math
+import threading
+from collections import OrderedDict
+
+from flask import has_request_context, request
+from pymongo import monitoring
+
+# 各命令中需要提取 shape 的字段
+SHAPE_FIELDS = {
+    "find": ["filter", "sort", "projection"],
+    "count": ["query"],
+    "distinct": ["key", "query"],
+    "aggregate": ["pipeline"],
+    "findAndModify": ["query", "sort", "update"],
+    "delete": ["deletes"],
+    "update": ["updates"],
+    "insert": [],
+    "getMore": [],
+}
+
+# 可以通过 explain 重放的只读命令，会为每个 shape 保留一条样例命令
+EXPLAINABLE_COMMANDS = ("find", "count", "distinct", "aggregate")
+
+
+def get_value_shape(value):
+    """去掉具体的值，只保留字段名和操作符，{"a": 1, "b": {"$in": [1, 2]}} -> {"a": "?", "b": {"$in": "?"}}"""
+    if isinstance(value, dict):
+        return {k: get_value_shape(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        # $and/$or/pipeline 等由文档组成的数组保留结构，值数组统一为 ?
+        if value and all(isinstance(it, dict) for it in value):
+            return [get_value_shape(it) for it in value]
+    return "?"
+
+
+def get_command_shape(command_name, command):
+    """返回 (collection, shape)，shape 为去掉了具体值的命令结构"""
+    collection = command.get(command_name)
+    if command_name == "getMore":
+        collection = command.get("collection")
+    if not isinstance(collection, str):
+        collection = ""
+
+    shape = {"command": command_name}
+    for field in SHAPE_FIELDS.get(command_name, []):
+        if field not in command:
+            continue
+        value = command[field]
+        if field == "sort":
+            shape[field] = list(dict(value).items())
+        elif field == "projection":
+            shape[field] = list(dict(value).keys())
+        elif field == "key":
+            shape[field] = value
+        elif field in ("deletes", "updates"):
+            # 批量写只取第一条语句的结构
+            first = value[0] if value else {}
+            shape[field] = get_value_shape(
+                {k: v for k, v in first.items() if k in ("q", "u", "multi", "upsert", "limit")}
+            )
+        else:
+            shape[field] = get_value_shape(value)
+    return collection, json.dumps(shape, default=str, ensure_ascii=False)
+
+
+class LatencyHistogram(object):
+    """
+    HDR 风格的对数线性直方图：每个 2 的幂区间再均分为 SUB_BUCKETS 个桶，
+    相对误差约 1 / SUB_BUCKETS，桶数固定，内存占用与样本数量无关
+    """
+
+    SUB_BUCKETS = 16
+    # 单位为微秒，最大记录约 2^36 微秒（约 19 小时）
+    MAX_EXPONENT = 36
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def bucket(self, micros):
+        if micros < self.SUB_BUCKETS:
+            return int(micros)
+        exponent = min(int(math.log2(micros)), self.MAX_EXPONENT)
+        sub = int(micros / (2 ** exponent) * self.SUB_BUCKETS) - self.SUB_BUCKETS
+        return exponent * self.SUB_BUCKETS + min(sub, self.SUB_BUCKETS - 1)
+
+    def bucket_value(self, index):
+        """桶的上界（微秒）"""
+        if index < self.SUB_BUCKETS:
+            return index
+        exponent, sub = divmod(index, self.SUB_BUCKETS)
+        return (2 ** exponent) * (self.SUB_BUCKETS + sub + 1) / self.SUB_BUCKETS
+
+    def record(self, micros):
+        index = self.bucket(max(micros, 0))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += micros
+        self.max = max(self.max, micros)
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0
+        target = math.ceil(self.count * percent / 100)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self.bucket_value(index), self.max)
+        return self.max
+
+
+class QueryStats(object):
+    """按 (shape, collection, route) 聚合 mongo 命令的次数、耗时和延迟分位数，最多保留 max_keys 组"""
+
+    OTHER_SHAPE = "__other__"
+
+    def __init__(self, max_keys=1000):
+        self.max_keys = max_keys
+        self._stats = {}
+        # 每个 key 保留一条样例命令，供索引建议重放 explain
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, collection, shape, route, micros, sample=None):
+        key = (shape, collection, route)
+        with self._lock:
+            histogram = self._stats.get(key)
+            if histogram is None:
+                if len(self._stats) >= self.max_keys:
+                    # 超出上限的 shape 合并统计，保证内存固定
+                    key = (self.OTHER_SHAPE, "", "")
+                    histogram = self._stats.get(key)
+                    sample = None
+                if histogram is None:
+                    histogram = LatencyHistogram()
+                    self._stats[key] = histogram
+                if sample is not None:
+                    self._samples[key] = sample
+            histogram.record(micros)
+
+    def snapshot(self):
+        """按总耗时倒序返回所有 shape 的统计，时间单位为毫秒"""
+        with self._lock:
+            items = [(key, histogram) for key, histogram in self._stats.items()]
+            result = [
+                {
+                    "shape": shape,
+                    "collection": collection,
+                    "route": route,
+                    "count": histogram.count,
+                    "total_ms": histogram.total / 1000,
+                    "avg_ms": histogram.total / histogram.count / 1000,
+                    "max_ms": histogram.max / 1000,
+                    "p50_ms": histogram.percentile(50) / 1000,
+                    "p90_ms": histogram.percentile(90) / 1000,
+                    "p99_ms": histogram.percentile(99) / 1000,
+                }
+                for (shape, collection, route), histogram in items
+            ]
+        return sorted(result, key=lambda it: it["total_ms"], reverse=True)
+
+    def samples(self):
+        """[(统计项, 样例命令)]，按总耗时倒序，只包含可 explain 的命令"""
+        with self._lock:
+            samples = dict(self._samples)
+        return [
+            (item, samples[(item["shape"], item["collection"], item["route"])])
+            for item in self.snapshot()
+            if (item["shape"], item["collection"], item["route"]) in samples
+        ]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._samples.clear()
+
+
+query_stats = QueryStats()
+
+
+def get_route():
+    if not has_request_context():
+        return ""
+    return request.url_rule.rule if request.url_rule else request.path
+
+
+class QueryStatsListener(monitoring.CommandListener):
+    """命令监听器，只计算 shape 和耗时，不格式化语句；每条命令计算 shape 约十几微秒"""
+
+    def __init__(self, stats=query_stats, max_pending=10000):
+        self.stats = stats
+        # request_id -> (collection, shape, route, sample)，命令结束时移除；
+        # 超过 max_pending 时丢弃最早的，防止没有结束事件的命令泄漏
+        self._pending = OrderedDict()
+        self.max_pending = max_pending
+
+    def started(self, event):
+        collection, shape = get_command_shape(event.command_name, event.command)
+        sample = event.command if event.command_name in EXPLAINABLE_COMMANDS else None
+        self._pending[event.request_id] = (collection, shape, get_route(), sample)
+        while len(self._pending) > self.max_pending:
+            try:
+                self._pending.popitem(last=False)
+            except KeyError:
+                break
+
+    def succeeded(self, event):
+        info = self._pending.pop(event.request_id, None)
+        if info:
+            collection, shape, route, sample = info
+            self.stats.record(collection, shape, route, event.duration_micros, sample)
+
+    def failed(self, event):
+        info = self._pending.pop(event.request_id, None)
+        if info:
+            collection, shape, route, sample = info
+            self.stats.record(collection, shape, route, event.duration_micros, sample)
+
+
+def register_query_stats_listener(config=None, section="QUERY_STATS"):
+    """开发环境始终注册，生产环境只有 config 中开启了才注册"""
+    # panels 会导入本模块，这里延迟导入
+    from debug_toolbar.mongo_listener import is_flask_debug
+
+    enabled = config is not None and config.getboolean(section, "ENABLED", fallback=False)
+    if not is_flask_debug() and not enabled:
+        return None
+    listener = QueryStatsListener(
+        max_pending=config.getint(section, "MAX_PENDING", fallback=10000) if config else 10000
+    )
+    monitoring.register(listener)
+    return listener
@@ -0,0 +1,39 @@
+import itertools
+from operator import itemgetter
+
+
+class RingBuffer(object):
+    """
+    定长环形缓冲区，写入不加锁：itertools.count 的 next() 和 list 元素赋值在 CPython 中都是原子操作，
+    多线程同时写入时最多覆盖掉最早的数据。每个槽位保存 (写入序号, 数据)，读取时按序号从新到旧排列，
+    不依赖单独维护的写入计数，并发写入时快照不会重复或倒退。迭代顺序与 deque.appendleft 的用法一致
+    """
+
+    def __init__(self, maxlen):
+        self.maxlen = maxlen
+        self._items = [None] * maxlen
+        self._counter = itertools.count()
+
+    def appendleft(self, item):
+        index = next(self._counter)
+        self._items[index % self.maxlen] = (index, item)
+
+    append = appendleft
+
+    def _snapshot(self):
+        items = [it for it in list(self._items) if it is not None]
+        return sorted(items, key=itemgetter(0), reverse=True)
+
+    def __len__(self):
+        return sum(1 for it in self._items if it is not None)
+
+    def __iter__(self):
+        for _, item in self._snapshot():
+            yield item
+
+    def __bool__(self):
+        return any(it is not None for it in self._items)
+
+    def clear(self):
+        self._items = [None] * self.maxlen
+        self._counter = itertools.count()
@@ -0,0 +1,313 @@
+import json
+import os
+import sqlite3
+import threading
+
+from bson import json_util
+
+from utils.background_writer import BackgroundWriter
+
+# 列表页只查询摘要字段，mongo_queries 在查看详情时再加载
+SUMMARY_FIELDS = (
+    "id, pid, method, path, status, duration, timestamp, saved_queries, query_count, findings"
+)
+
+# 旧版本创建的数据库中缺少的列
+MIGRATED_COLUMNS = (("query_count", "INTEGER"), ("findings", "TEXT"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pid INTEGER,
+    method TEXT,
+    path TEXT,
+    status INTEGER,
+    duration REAL,
+    timestamp TEXT,
+    saved_queries INTEGER,
+    query_count INTEGER,
+    findings TEXT,
+    mongo_queries TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_requests_path ON requests (path);
+CREATE INDEX IF NOT EXISTS idx_requests_status ON requests (status);
+CREATE INDEX IF NOT EXISTS idx_requests_duration ON requests (duration);
+CREATE INDEX IF NOT EXISTS idx_requests_timestamp ON requests (timestamp);
+CREATE TABLE IF NOT EXISTS mongo_queries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pid INTEGER,
+    command TEXT,
+    collection TEXT,
+    duration REAL,
+    timestamp REAL,
+    path TEXT,
+    error TEXT,
+    raw_command TEXT
+);
+"""
+
+
+def query_to_dict(query):
+    return {
+        "command": query.command,
+        "collection": query.collection,
+        "duration": query.duration,
+        "timestamp": query.timestamp,
+        "path": query.path,
+        "error": query.error,
+        "raw_command": json_util.dumps(query.raw_command),
+    }
+
+
+def dict_to_query(data):
+    # 避免循环导入
+    from debug_toolbar.mongo_listener import MongoQuery
+
+    return MongoQuery(
+        command=data["command"],
+        collection=data["collection"],
+        duration=data["duration"],
+        timestamp=data["timestamp"],
+        path=data["path"],
+        raw_command=json_util.loads(data["raw_command"]),
+        error=data["error"],
+    )
+
+
+class SharedStore(object):
+    """
+    多个 gunicorn worker 共用的请求历史和 mongo 命令存储，基于 SQLite WAL（读写互不阻塞）。
+    请求线程只把数据放入 BackgroundWriter 的有界队列（满了直接丢弃），由后台线程批量写入，
+    跨进程的写锁只在后台线程中获取；面板从数据库中读取所有 worker 的数据
+    """
+
+    def __init__(self, path, max_requests=10000, max_queries=2000, queue_size=10000):
+        self.path = path
+        self.max_requests = max_requests
+        self.max_queries = max_queries
+        self._local = threading.local()
+        self._writes = 0
+        self._writer = BackgroundWriter(self._write, "shared-store", queue_size=queue_size)
+        # 在主进程建表，worker 中不再需要
+        conn = self._connect()
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(requests)")]
+        for name, column_type in MIGRATED_COLUMNS:
+            if columns and name not in columns:
+                # 兼容旧版本创建的数据库
+                conn.execute(f"ALTER TABLE requests ADD COLUMN {name} {column_type}")
+        conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _get_conn(self):
+        # 连接不能跨 fork 使用，按线程和进程缓存
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @property
+    def dropped(self):
+        return self._writer.dropped
+
+    def append_request(self, request_data):
+        self._writer.put(("request", request_data))
+
+    def append_query(self, query):
+        self._writer.put(("query", query))
+
+    def _write(self, items):
+        """一次事务写入一批数据，每 20 批清理一次旧数据"""
+        conn = self._get_conn()
+        self._insert(conn, items)
+        self._writes += 1
+        if self._writes % 20 == 0:
+            self._trim(conn)
+
+    def _insert(self, conn, items):
+        requests = []
+        queries = []
+        pid = os.getpid()
+        for kind, data in items:
+            if kind == "request":
+                requests.append(self._request_row(pid, data))
+            else:
+                query = query_to_dict(data)
+                queries.append(
+                    (
+                        pid,
+                        query["command"],
+                        query["collection"],
+                        query["duration"],
+                        query["timestamp"],
+                        query["path"],
+                        query["error"],
+                        query["raw_command"],
+                    )
+                )
+        with conn:
+            if requests:
+                conn.executemany(
+                    "INSERT INTO requests (pid, method, path, status, duration, timestamp, "
+                    "saved_queries, query_count, findings, mongo_queries) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    requests,
+                )
+            if queries:
+                conn.executemany(
+                    "INSERT INTO mongo_queries (pid, command, collection, duration, timestamp, "
+                    "path, error, raw_command) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    queries,
+                )
+
+    def _request_row(self, pid, data):
+        return (
+            pid,
+            data["method"],
+            data["path"],
+            data["status"],
+            data["duration"],
+            data["timestamp"],
+            data.get("saved_queries", 0),
+            data.get("query_count", len(data["mongo_queries"])),
+            json.dumps(data.get("findings", []), ensure_ascii=False),
+            json.dumps([query_to_dict(it) for it in data["mongo_queries"]]),
+        )
+
+    def _trim(self, conn):
+        """只保留最近的 max_requests/max_queries 条，max_requests 为 0 时请求历史不清理"""
+        with conn:
+            if self.max_requests > 0:
+                conn.execute(
+                    "DELETE FROM requests WHERE id <= (SELECT MAX(id) FROM requests) - ?",
+                    (self.max_requests,),
+                )
+            conn.execute(
+                "DELETE FROM mongo_queries WHERE id <= (SELECT MAX(id) FROM mongo_queries) - ?",
+                (self.max_queries,),
+            )
+
+    def requests(self, limit=50):
+        rows = self._get_conn().execute(
+            "SELECT * FROM requests ORDER BY id DESC LIMIT ?", (limit,)
+        )
+        result = []
+        for row in rows:
+            data = dict(row)
+            data["mongo_queries"] = [
+                dict_to_query(it) for it in json.loads(data["mongo_queries"])
+            ]
+            data["findings"] = json.loads(data["findings"] or "[]")
+            result.append(data)
+        return result
+
+    def search_requests(
+        self,
+        path=None,
+        statuses=None,
+        min_duration=None,
+        max_duration=None,
+        since=None,
+        until=None,
+        cursor=None,
+        page_size=50,
+    ):
+        """
+        keyset 分页查询请求摘要，返回 (摘要列表, 下一页的 cursor)，按 id 倒序，cursor 为上一页最后一条的 id，
+        没有下一页时为 None。不用 OFFSET 和 COUNT(*)，翻到很靠后的页也只扫描一页的数据。
+        path 以 / 开头时按前缀匹配（走索引），否则按子串匹配；since/until 为 "%Y-%m-%d %H:%M:%S"
+        """
+        where = []
+        params = []
+        if cursor:
+            where.append("id < ?")
+            params.append(cursor)
+        if path:
+            if path.startswith("/"):
+                # 前缀范围查询，可以使用 path 索引
+                where.append("path >= ? AND path < ?")
+                params.extend([path, path + "\uffff"])
+            else:
+                where.append("path LIKE ?")
+                params.append(f"%{path}%")
+        if statuses:
+            where.append(f"status IN ({', '.join('?' * len(statuses))})")
+            params.extend(statuses)
+        if min_duration is not None:
+            where.append("duration >= ?")
+            params.append(min_duration)
+        if max_duration is not None:
+            where.append("duration <= ?")
+            params.append(max_duration)
+        if since:
+            where.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            where.append("timestamp <= ?")
+            params.append(until)
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+
+        # 多取一条判断是否还有下一页
+        rows = self._get_conn().execute(
+            f"SELECT {SUMMARY_FIELDS} FROM requests {where_sql} ORDER BY id DESC LIMIT ?",
+            params + [page_size + 1],
+        )
+        items = []
+        for row in rows:
+            item = dict(row)
+            item["findings"] = json.loads(item["findings"] or "[]")
+            items.append(item)
+        next_cursor = items[page_size - 1]["id"] if len(items) > page_size else None
+        return items[:page_size], next_cursor
+
+    def get_request_queries(self, request_id):
+        row = self._get_conn().execute(
+            "SELECT mongo_queries FROM requests WHERE id = ?", (request_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return [dict_to_query(it) for it in json.loads(row["mongo_queries"])]
+
+    def queries(self, limit=200):
+        rows = self._get_conn().execute(
+            "SELECT * FROM mongo_queries ORDER BY id DESC LIMIT ?", (limit,)
+        )
+        return [dict_to_query(dict(row)) for row in rows]
+
+    def count_requests(self):
+        """
+        请求历史条数，每次渲染工具栏都会调用，不用 COUNT(*)（全表扫描）：MAX(id)/MIN(id) 直接读取主键 B 树的两端。
+        id 自增且 _trim 只删除最早的一段，结果与 COUNT(*) 一致
+        """
+        # 写在一个 SELECT 中时 SQLite 不做 min/max 优化，会扫描全表，需要分成两个子查询
+        row = self._get_conn().execute(
+            "SELECT (SELECT MAX(id) FROM requests) - (SELECT MIN(id) FROM requests) + 1"
+        ).fetchone()
+        return row[0] or 0
+
+
+__store = None
+
+
+def init_store(config, section="SHARED_STORE"):
+    global __store
+    if not config.getboolean(section, "ENABLED", fallback=False):
+        return None
+    __store = SharedStore(
+        config.get(section, "PATH", fallback="debug_toolbar.sqlite"),
+        max_requests=config.getint(section, "MAX_REQUESTS", fallback=10000),
+        max_queries=config.getint(section, "MAX_QUERIES", fallback=2000),
+    )
+    return __store
+
+
+def get_store():
+    """开启了共享存储时返回 SharedStore，否则返回 None，面板和监听器使用进程内的 deque"""
+    return __store
@@ -0,0 +1,201 @@
+import json
+import logging
+import logging.handlers
+import os
+import time
+from collections import OrderedDict
+
+from bson import json_util
+from pymongo import monitoring
+
+from debug_toolbar.query_stats import EXPLAINABLE_COMMANDS, get_route
+from utils.background_writer import BackgroundWriter
+
+
+class RateLimiter(object):
+    """令牌桶限流，每分钟最多 per_minute 次"""
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = max(per_minute, 1)
+        self.tokens = self.capacity
+        self.last_time = time.time()
+
+    def acquire(self):
+        now = time.time()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_time) * self.rate)
+        self.last_time = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+def truncate_command(command, max_bytes):
+    """命令转为 extended json，超过 max_bytes 时截断，避免大批量写入撑大日志"""
+    text = json_util.dumps(command, ensure_ascii=False)
+    if len(text) > max_bytes:
+        text = text[:max_bytes] + f"...(truncated, {len(text)} chars)"
+    return text
+
+
+class SlowQueryRecorder(object):
+    """
+    生产环境慢查询记录：超过阈值的命令放入 BackgroundWriter 的有界队列，由后台线程获取 explain("executionStats")
+    并写入按大小轮转的 json lines 日志文件。请求线程只做一次入队，队列满时直接丢弃；
+    explain 会重新执行查询，按 explain_per_minute 限流，超出时只记录命令不做 explain（限流器只在后台线程中使用）。
+    多个 gunicorn worker 轮转同一个文件会互相覆盖，每个进程写入自己的文件：slow_query.log -> slow_query.<pid>.log
+    """
+
+    def __init__(
+        self,
+        log_file,
+        threshold_ms=100,
+        collection_thresholds=None,
+        explain_per_minute=10,
+        max_bytes=10 * 1024 * 1024,
+        backup_count=5,
+        max_command_bytes=4096,
+        queue_size=1000,
+    ):
+        self.threshold_ms = threshold_ms
+        self.collection_thresholds = collection_thresholds or {}
+        self.max_command_bytes = max_command_bytes
+        self.log_file = log_file
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._limiter = RateLimiter(explain_per_minute)
+
+        self._logger = logging.getLogger("mongo.slow_query")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+
+        self._writer = BackgroundWriter(
+            self._write,
+            "slow-query",
+            queue_size=queue_size,
+            batch_size=1,
+            on_start=self._open,
+        )
+
+    def get_threshold(self, collection):
+        return self.collection_thresholds.get(collection, self.threshold_ms)
+
+    def get_log_file(self, pid):
+        root, ext = os.path.splitext(self.log_file)
+        return f"{root}.{pid}{ext}"
+
+    @property
+    def dropped(self):
+        return self._writer.dropped
+
+    def _open(self):
+        handler = logging.handlers.RotatingFileHandler(
+            self.get_log_file(os.getpid()),
+            maxBytes=self.max_bytes,
+            backupCount=self.backup_count,
+            encoding="utf-8",
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self._logger.handlers = [handler]
+
+    def submit(self, record):
+        self._writer.put(record)
+
+    def _write(self, records):
+        # 避免循环导入
+        from debug_toolbar.index_advisor import explain_command
+
+        for record in records:
+            command = record.pop("raw_command")
+            record["command"] = truncate_command(command, self.max_command_bytes)
+            record["explain"] = None
+            if record["command_name"] in EXPLAINABLE_COMMANDS:
+                if self._limiter.acquire():
+                    try:
+                        explain = explain_command(
+                            record["command_name"], command, verbosity="executionStats"
+                        )
+                        record["explain"] = json.loads(json_util.dumps(explain))
+                    except Exception as ex:
+                        record["explain_error"] = repr(ex)
+                else:
+                    record["explain_error"] = "rate limited"
+            self._logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    def __init__(self, recorder, max_pending=10000):
+        self.recorder = recorder
+        # request_id -> (command, route)，命令结束时移除；超过 max_pending 时丢弃最早的，防止泄漏
+        self._pending = OrderedDict()
+        self.max_pending = max_pending
+
+    def started(self, event):
+        if event.command_name == "explain":
+            return
+        self._pending[event.request_id] = (event.command, get_route())
+        while len(self._pending) > self.max_pending:
+            try:
+                self._pending.popitem(last=False)
+            except KeyError:
+                break
+
+    def _finish(self, event, error=""):
+        info = self._pending.pop(event.request_id, None)
+        if not info:
+            return
+        command, route = info
+        collection = command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        duration = event.duration_micros / 1000
+        if duration < self.recorder.get_threshold(collection):
+            return
+        self.recorder.submit(
+            {
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "command_name": event.command_name,
+                "collection": collection,
+                "database": event.database_name,
+                "duration": duration,
+                "route": route,
+                "error": error,
+                "raw_command": command,
+            }
+        )
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, error=str(event.failure))
+
+
+def parse_thresholds(value):
+    """"task:50,ids:10" -> {"task": 50.0, "ids": 10.0}"""
+    thresholds = {}
+    for item in value.split(","):
+        if ":" in item:
+            collection, threshold = item.split(":", 1)
+            thresholds[collection.strip()] = float(threshold)
+    return thresholds
+
+
+def register_slow_query_listener(config, section="SLOW_QUERY"):
+    if not config.getboolean(section, "ENABLED", fallback=False):
+        return None
+
+    recorder = SlowQueryRecorder(
+        log_file=config.get(section, "LOG_FILE", fallback="slow_query.log"),
+        threshold_ms=config.getfloat(section, "THRESHOLD_MS", fallback=100),
+        collection_thresholds=parse_thresholds(
+            config.get(section, "COLLECTION_THRESHOLDS", fallback="")
+        ),
+        explain_per_minute=config.getint(section, "EXPLAIN_PER_MINUTE", fallback=10),
+        max_bytes=config.getint(section, "MAX_BYTES", fallback=10 * 1024 * 1024),
+        backup_count=config.getint(section, "BACKUP_COUNT", fallback=5),
+    )
+    listener = SlowQueryListener(recorder)
+    monitoring.register(listener)
+    return listener
@@ -0,0 +1,148 @@
+import json
+import os
+import random
+import time
+from contextvars import ContextVar
+
+from flask import request
+from pymongo import monitoring
+
+from utils.background_writer import BackgroundWriter
+
+# 调试、监控接口不录制
+EXCLUDED_PREFIXES = (
+    "/_debug_toolbar",
+    "/_mongo",
+    "/static",
+    "/flask-profiler",
+    "/metrics",
+)
+
+# 回放请求的响应中返回该请求执行的 mongo 语句数
+QUERY_COUNT_HEADER = "X-Mongo-Queries"
+
+# 回放请求的 mongo 语句计数，只有带 REPLAY_HEADER 的请求才会设置
+_replay_count = ContextVar("replay_query_count", default=None)
+
+
+class ReplayCounter(object):
+    __slots__ = ("count",)
+
+    def __init__(self):
+        self.count = 0
+
+
+class ReplayQueryCountListener(monitoring.CommandListener):
+    """
+    只统计回放请求的 mongo 语句数，不采集命令内容；
+    回放不能使用 TRACE_HEADER，否则每个请求都会全量采集并写入请求历史，压测结果里包含了调试开销
+    """
+
+    def started(self, event):
+        counter = _replay_count.get()
+        if counter is not None:
+            counter.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class TrafficRecorder(object):
+    """
+    把真实请求（method、path、参数、body）录制到 jsonl 文件，供 benchmarks/replay_traffic.py 回放。
+    请求线程只做一次入队，由 BackgroundWriter 批量追加写入；多个 worker 以 O_APPEND 写同一个文件，
+    每批只调用一次 write，行之间不会交错。route 为匹配到的路由规则，回放时按路由汇总
+    """
+
+    def __init__(self, path, sample_rate=1.0, max_body_bytes=64 * 1024, queue_size=10000):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_body_bytes = max_body_bytes
+        self.skipped = 0
+        self._fd = None
+        self._writer = BackgroundWriter(
+            self._write,
+            "traffic-recorder",
+            queue_size=queue_size,
+            on_start=self._open,
+        )
+
+    def should_record(self, path):
+        if path.startswith(EXCLUDED_PREFIXES):
+            return False
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def record(self, req, status):
+        body = req.get_data(cache=True)
+        if len(body) > self.max_body_bytes:
+            self.skipped += 1
+            return
+
+        args = req.args.to_dict(flat=False)
+        # _debug 会把 json 响应包装成 html，回放时去掉
+        args.pop("_debug", None)
+        item = {
+            "timestamp": time.time(),
+            "method": req.method,
+            "path": req.path,
+            "route": req.url_rule.rule if req.url_rule else None,
+            "args": args,
+            "content_type": req.content_type,
+            "body": body.decode("utf-8", errors="replace"),
+            "status": status,
+        }
+        self._writer.put(item)
+
+    def _open(self):
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _write(self, items):
+        lines = "".join(json.dumps(it, ensure_ascii=False) + "\n" for it in items)
+        os.write(self._fd, lines.encode("utf-8"))
+
+
+def register_traffic_capture(app, config, section="TRAFFIC_CAPTURE"):
+    """
+    开启录制时记录所有业务请求；带有 REPLAY_HEADER 的请求（回放工具发出）在响应头中返回 mongo 语句数，
+    只计数不采集命令，不受 MONGO_CAPTURE 的配置影响
+    """
+    replay_header = config.get(section, "REPLAY_HEADER", fallback="X-Replay")
+    # 不是回放请求时每条命令只多一次 ContextVar.get
+    monitoring.register(ReplayQueryCountListener())
+
+    @app.before_request
+    def before_replay_request():
+        if replay_header in request.headers:
+            _replay_count.set(ReplayCounter())
+
+    @app.after_request
+    def after_replay_request(response):
+        counter = _replay_count.get()
+        if counter is not None:
+            response.headers[QUERY_COUNT_HEADER] = str(counter.count)
+        return response
+
+    @app.teardown_request
+    def teardown_replay_request(exc):
+        _replay_count.set(None)
+
+    if not config.getboolean(section, "ENABLED", fallback=False):
+        return None
+
+    recorder = TrafficRecorder(
+        config.get(section, "FILE", fallback="traffic.jsonl"),
+        sample_rate=config.getfloat(section, "SAMPLE_RATE", fallback=1.0),
+        max_body_bytes=config.getint(section, "MAX_BODY_BYTES", fallback=64 * 1024),
+    )
+
+    @app.after_request
+    def record_traffic(response):
+        # 回放产生的请求不再录制
+        if replay_header not in request.headers and recorder.should_record(request.path):
+            recorder.record(request, response.status_code)
+        return response
+
+    return recorder
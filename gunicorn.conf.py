@@ -0,0 +1,20 @@
+import configparser
+import os
+
+from utils.metrics import MULTIPROC_ENV, clear_multiproc_dir, get_multiproc_dir, mark_process_dead
+
+# gunicorn 启动时自动读取当前目录下的 gunicorn.conf.py，命令行参数仍然生效
+config = configparser.ConfigParser()
+config.read(os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.properties"))
+multiproc_dir = get_multiproc_dir(config) if config.getboolean("METRICS", "ENABLED", fallback=False) else ""
+
+
+def on_starting(server):
+    # 清空上次运行留下的 worker 指标文件，worker 继承该环境变量
+    if multiproc_dir:
+        clear_multiproc_dir(multiproc_dir)
+        os.environ[MULTIPROC_ENV] = multiproc_dir
+
+
+def child_exit(server, worker):
+    mark_process_dead(worker.pid)
@@ -1,4 +1,13 @@
 from utils.mongo_tool import MongoBase
+from utils.async_mongo_tool import AsyncMongoBase
+
+# 不开启 __cache__：缓存按进程失效，gunicorn 多 worker 时其他 worker 最多读到 ttl 秒前的旧数据
 
 class Task(MongoBase):
   __collection__ = "task"
+  __identity_map__ = True
+
+
+class AsyncTask(AsyncMongoBase):
+  __collection__ = "task"
+  __identity_map__ = True
@@ -0,0 +1,178 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.mongo_tool import MongoBase, config
+
+# 执行同步 pymongo 调用的线程池，pymongo 的 MongoClient 本身线程安全
+__executor = None
+
+
+def executor():
+    global __executor
+    if not __executor:
+        max_workers = config.getint("SERVER_INFO", "ASYNC_MAX_WORKERS", fallback=32)
+        __executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="async-mongo"
+        )
+    return __executor
+
+
+def reset_executor_after_fork():
+    # fork 前创建的线程不会被子进程继承，子进程中重新创建线程池
+    global __executor
+    __executor = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_executor_after_fork)
+
+
+async def run_in_executor(func, *args, **kwargs):
+    """在线程池中执行同步函数，复制 contextvars 以保留 flask 的请求上下文"""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(
+        executor(), functools.partial(ctx.run, func, *args, **kwargs)
+    )
+
+
+class AsyncMongoBase(object):
+    """MongoBase 的 asyncio 版本，classmethod 与 MongoBase 一一对应
+
+    每个方法都委托给同步的 MongoBase 实现并在线程池中执行，日志和耗时统计与同步版本一致，
+    可以在 async def 视图中用 asyncio.gather 并发发起多个查询：
+
+        task, count = await asyncio.gather(
+            AsyncTask.find_one({"_id": id}), AsyncTask.count({"status": 1})
+        )
+
+    注意 return_cursor=True 返回的仍是同步 cursor，遍历时会阻塞事件循环。
+    """
+
+    __cache__ = None
+    __id_block_size__ = 1
+    __identity_map__ = False
+    __indexes__ = []
+    # 复制到同步 model 上的声明属性
+    __model_attrs = ("__cache__", "__id_block_size__", "__identity_map__", "__indexes__")
+    __sync_models = {}
+
+    @classmethod
+    def get_collection_name(cls):
+        return MongoBase.get_collection_name.__func__(cls)
+
+    @classmethod
+    def sync_model(cls):
+        """
+        与当前类使用同一个 collection 和相同声明（缓存、号段、identity map、索引）的同步 MongoBase 子类，
+        按类缓存，同一个 collection 的多个 async model 各自使用自己的声明
+        """
+        model = AsyncMongoBase.__sync_models.get(cls)
+        if model is None:
+            attrs = {name: getattr(cls, name) for name in AsyncMongoBase.__model_attrs}
+            attrs["__collection__"] = cls.get_collection_name()
+            model = type(cls.__name__, (MongoBase,), attrs)
+            AsyncMongoBase.__sync_models[cls] = model
+        return model
+
+    @classmethod
+    async def _call(cls, name, *args, **kwargs):
+        return await run_in_executor(
+            getattr(cls.sync_model(), name), *args, **kwargs
+        )
+
+    @classmethod
+    async def insert_obj(cls, data):
+        return await cls._call("insert_obj", data)
+
+    @classmethod
+    async def distinct(cls, name, filter=None):
+        return await cls._call("distinct", name, filter=filter)
+
+    @classmethod
+    async def insert(cls, **kwargs):
+        return await cls._call("insert", **kwargs)
+
+    @classmethod
+    async def insert_many(cls, data, ordered=True):
+        return await cls._call("insert_many", data, ordered=ordered)
+
+    @classmethod
+    async def insert_stream(cls, data, **kwargs):
+        return await cls._call("insert_stream", data, **kwargs)
+
+    @classmethod
+    async def upsert(cls, filter, update, print_log=True):
+        return await cls._call("upsert", filter, update, print_log=print_log)
+
+    @classmethod
+    async def count(cls, filter=None):
+        return await cls._call("count", filter)
+
+    @classmethod
+    async def update(cls, filter, update, **kwargs):
+        return await cls._call("update", filter, update, **kwargs)
+
+    @classmethod
+    async def update_one(cls, filter, update, **kwargs):
+        return await cls._call("update_one", filter, update, **kwargs)
+
+    @classmethod
+    async def find_one(cls, filter=None, **kwargs):
+        return await cls._call("find_one", filter, **kwargs)
+
+    @classmethod
+    async def find(cls, filter=None, **kwargs):
+        return await cls._call("find", filter, **kwargs)
+
+    @classmethod
+    async def find_by_keys(cls, keys, **kwargs):
+        return await cls._call("find_by_keys", keys, **kwargs)
+
+    @classmethod
+    async def find_page(cls, filter=None, **kwargs):
+        return await cls._call("find_page", filter, **kwargs)
+
+    @classmethod
+    async def iter_find(cls, filter=None, batch_size=1000, **kwargs):
+        """异步生成器版本的 iter_find，每批数据在线程池中获取"""
+        cursor = None
+        while True:
+            page = await cls.find_page(
+                filter, cursor=cursor, page_size=batch_size, **kwargs
+            )
+            for item in page["data"]:
+                yield item
+
+            cursor = page["next_cursor"]
+            if not cursor:
+                return
+
+    @classmethod
+    async def delete(cls, filter=None, real_delete=False, multi=False):
+        return await cls._call(
+            "delete", filter, real_delete=real_delete, multi=multi
+        )
+
+    @classmethod
+    async def get_auto_increasing_id(cls):
+        return await cls._call("get_auto_increasing_id")
+
+    @classmethod
+    async def get_auto_increasing_ids(cls, n):
+        return await cls._call("get_auto_increasing_ids", n)
+
+    @classmethod
+    async def set_auto_increasing_id(cls, id):
+        return await cls._call("set_auto_increasing_id", id)
+
+    @classmethod
+    async def aggregate(cls, match=None, **kwargs):
+        return await cls._call("aggregate", match, **kwargs)
+
+    @classmethod
+    async def sync_indexes(cls):
+        return await cls._call("sync_indexes")
@@ -0,0 +1,105 @@
+import logging
+import os
+import threading
+from collections import deque
+
+
+class _FlushMarker(object):
+    __slots__ = ("done",)
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class BackgroundWriter(object):
+    """
+    进程内的有界队列 + 后台守护线程批量写入，请求线程只做一次入队，用于日志、请求历史、流量录制、慢查询等。
+    队列使用 deque（append / popleft 在 CPython 中是原子的），入队不加锁，队列满时丢弃并计数，
+    只在队列由空变为非空时唤醒后台线程。
+    fork 之后后台线程不会被继承，每个进程第一次 put 时创建自己的队列并启动线程，只在启动时加锁；
+    on_start 在后台线程开始处理前调用（打开文件、数据库连接等），write_batch(items) 每次最多处理 batch_size 条
+    """
+
+    def __init__(
+        self,
+        write_batch,
+        name,
+        queue_size=10000,
+        batch_size=500,
+        idle_interval=None,
+        on_start=None,
+    ):
+        self.write_batch = write_batch
+        self.name = name
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        # 空闲时的最长等待时间，None 表示一直等到有新数据
+        self.idle_interval = idle_interval
+        self.on_start = on_start
+        self.dropped = 0
+        self._queue = deque()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(self, item):
+        """入队，队列满时丢弃并返回 False"""
+        if self._pid != os.getpid():
+            self._start()
+        if len(self._queue) >= self.queue_size:
+            self.dropped += 1
+            return False
+        self._queue.append(item)
+        if not self._wakeup.is_set():
+            self._wakeup.set()
+        return True
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = deque()
+            self._wakeup = threading.Event()
+            thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        if self.on_start is not None:
+            self.on_start()
+        while True:
+            if not self._queue:
+                self._wakeup.wait(self.idle_interval)
+                self._wakeup.clear()
+                # clear 之前入队的数据不会再唤醒，重新检查一次队列
+                if not self._queue:
+                    continue
+            items = []
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.popleft())
+                except IndexError:
+                    break
+
+            data = [it for it in items if not isinstance(it, _FlushMarker)]
+            if data:
+                try:
+                    self.write_batch(data)
+                except Exception as ex:
+                    logging.error("%s write failed: %r", self.name, ex)
+            # flush 放入的标记，写完它之前的数据后通知等待方
+            for it in items:
+                if isinstance(it, _FlushMarker):
+                    it.done.set()
+
+    def flush(self, timeout=5):
+        """等待调用之前入队的数据全部写出，最多等待 timeout 秒，返回是否写完"""
+        if self._pid != os.getpid():
+            return True
+        marker = _FlushMarker()
+        self._queue.append(marker)
+        self._wakeup.set()
+        return marker.done.wait(timeout)
@@ -0,0 +1,113 @@
+from flask import g, has_request_context
+from pydash import py_
+
+from utils.mongo_cache import MISSING
+
+
+class LoadResult(object):
+    """load 返回的延迟结果，第一次 get() 时把 loader 中收集到的所有 key 合并为一次查询"""
+
+    def __init__(self, loader, key):
+        self.loader = loader
+        self.key = key
+
+    def get(self):
+        return self.loader.get(self.key)
+
+
+class BatchLoader(object):
+    """
+    DataLoader 风格的批量加载器，把循环中逐个 find_one({field: key}) 合并为一次 $in 查询：
+
+        loader = Task.loader()
+        items = [loader.load(id) for id in ids]  # 只收集 key，不发起查询
+        tasks = [it.get() for it in items]       # 第一次 get 时一次查询全部 key
+
+    field 需要是唯一字段，不存在的 key 结果为 None；和 find_one 一样默认包含已软删除的文档
+    """
+
+    def __init__(
+        self,
+        model,
+        field="_id",
+        fields=None,
+        return_json=False,
+        is_include_deleted=True,
+        max_batch_size=1000,
+    ):
+        self.model = model
+        self.field = field
+        self.fields = fields
+        self.return_json = return_json
+        self.is_include_deleted = is_include_deleted
+        self.max_batch_size = max_batch_size
+        self._pending = []
+        self._results = {}
+
+    def load(self, key):
+        if key not in self._results:
+            self._pending.append(key)
+        return LoadResult(self, key)
+
+    def load_many(self, keys):
+        for key in keys:
+            self.load(key)
+        return [self.get(key) for key in keys]
+
+    def get(self, key):
+        value = self._results.get(key, MISSING)
+        if value is MISSING:
+            if key not in self._pending:
+                self._pending.append(key)
+            self.dispatch()
+            value = self._results[key]
+        return value
+
+    def dispatch(self):
+        keys = list(dict.fromkeys(it for it in self._pending if it not in self._results))
+        self._pending = []
+        for i in range(0, len(keys), self.max_batch_size):
+            batch = keys[i : i + self.max_batch_size]
+            data = self.model.find_by_keys(
+                batch,
+                field=self.field,
+                fields=self.fields,
+                return_json=self.return_json,
+                is_include_deleted=self.is_include_deleted,
+            )
+            self._results.update(zip(batch, data))
+
+    def clear(self):
+        self._pending = []
+        self._results = {}
+
+
+def get_loader(model, field="_id", fields=None, return_json=False, is_include_deleted=True):
+    """请求上下文中同一个 collection/参数共用一个 loader，不在请求中时每次新建"""
+    options = dict(
+        field=field, fields=fields, return_json=return_json, is_include_deleted=is_include_deleted
+    )
+    if not has_request_context():
+        return BatchLoader(model, **options)
+
+    if "mongo_loaders" not in g:
+        g.mongo_loaders = {}
+    key = (model.get_collection_name(), field, repr(fields), return_json, is_include_deleted)
+    loader = g.mongo_loaders.get(key)
+    if loader is None:
+        loader = BatchLoader(model, **options)
+        g.mongo_loaders[key] = loader
+    return loader
+
+
+def invalidate(col_name):
+    if has_request_context() and "mongo_loaders" in g:
+        for key, loader in g.mongo_loaders.items():
+            if key[0] == col_name:
+                loader.clear()
+
+
+def order_by_keys(data, keys, field):
+    """按 keys 的顺序排列查询结果，缺失的 key 填 None"""
+    mapping = {py_.get(it, field): it for it in data}
+    return [mapping.get(key) for key in keys]
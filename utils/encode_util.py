@@ -1,7 +1,10 @@
+import base64
 import json
-from bson import ObjectId
+from bson import ObjectId, Decimal128
 from datetime import datetime
 
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
 
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -9,8 +12,106 @@ class CustomJSONEncoder(json.JSONEncoder):
             return str(obj)  # 将 ObjectId 转换为字符串
 
         if isinstance(obj, datetime):
-            return obj.strftime(
-                "%Y-%m-%d %H:%M:%S"
-            )  # 将 datetime 转换为 ISO 格式字符串
+            return obj.strftime(DATETIME_FORMAT)  # 将 datetime 转换为 ISO 格式字符串
+
+        if isinstance(obj, Decimal128):
+            return str(obj)
+
+        if isinstance(obj, bytes):
+            return base64.b64encode(obj).decode("ascii")  # bytes/Binary 转为 base64
 
         return super().default(obj)
+
+
+_encoder = CustomJSONEncoder()
+
+
+def _convert_key(key):
+    # 与 json.dumps 对 dict key 的处理保持一致
+    if isinstance(key, str):
+        return str(key)
+    if key is True:
+        return "true"
+    if key is False:
+        return "false"
+    if key is None:
+        return "null"
+    if isinstance(key, int):
+        return int.__repr__(key)
+    if isinstance(key, float):
+        return json.dumps(float(key))
+    raise TypeError(
+        f"keys must be str, int, float, bool or None, not {key.__class__.__name__}"
+    )
+
+
+def _convert_dict(obj):
+    result = {}
+    for k, v in obj.items():
+        if type(k) is not str:
+            k = _convert_key(k)
+        # 标量直接赋值，减少函数调用
+        if type(v) in _SCALAR_TYPES:
+            result[k] = v
+        else:
+            result[k] = to_json_safe(v)
+    return result
+
+
+def _convert_list(obj):
+    return [v if type(v) in _SCALAR_TYPES else to_json_safe(v) for v in obj]
+
+
+def _same(obj):
+    return obj
+
+
+def _format_datetime(obj):
+    # isoformat 比 strftime 快一倍，年份小于 1000 时两者补零规则不同，交给 strftime
+    if obj.year >= 1000:
+        return obj.isoformat(" ")[:19]
+    return obj.strftime(DATETIME_FORMAT)
+
+
+_SCALAR_TYPES = frozenset([str, int, float, bool, type(None)])
+
+# 常见类型按 type 精确分发，避免逐个 isinstance 判断
+_CONVERTERS = {
+    str: _same,
+    int: _same,
+    float: _same,
+    bool: _same,
+    type(None): _same,
+    dict: _convert_dict,
+    list: _convert_list,
+    tuple: _convert_list,
+    ObjectId: str,
+    datetime: _format_datetime,
+}
+
+
+def to_json_safe(obj):
+    """
+    一次遍历把 BSON 结果转换为可直接 json 序列化的 python 对象，
+    结果与 json.loads(json.dumps(obj, cls=CustomJSONEncoder)) 完全一致
+    """
+    converter = _CONVERTERS.get(type(obj))
+    if converter is not None:
+        return converter(obj)
+
+    # 子类（SON/OrderedDict、Int64、bson.Binary 等）
+    if isinstance(obj, bool):
+        return bool(obj)
+    if isinstance(obj, int):
+        return int(obj)
+    if isinstance(obj, float):
+        return float(obj)
+    if isinstance(obj, str):
+        return str(obj)
+    if isinstance(obj, dict):
+        return _convert_dict(obj)
+    if isinstance(obj, (list, tuple)):
+        return _convert_list(obj)
+
+    value = _encoder.default(obj)
+    return to_json_safe(value)
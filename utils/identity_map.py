@@ -0,0 +1,67 @@
+import threading
+
+from flask import g, has_request_context
+
+from utils.mongo_cache import MISSING
+
+# AsyncMongoBase 在线程池中执行查询，同一个请求的 g 会被多个线程同时修改：
+# 创建 identity map、累加命中次数、失效时加锁；单个文档的读写是一次 dict 操作，不需要加锁
+__lock = threading.Lock()
+
+
+def get_identity_map(col_name):
+    """当前请求中 collection 的 identity map（_id -> 文档），不在请求上下文中时返回 None"""
+    if not has_request_context():
+        return None
+    with __lock:
+        if "mongo_identity_map" not in g:
+            g.mongo_identity_map = {}
+            g.mongo_identity_map_hits = 0
+        return g.mongo_identity_map.setdefault(col_name, {})
+
+
+def record_hit():
+    with __lock:
+        g.mongo_identity_map_hits = g.get("mongo_identity_map_hits", 0) + 1
+
+
+def get_hits():
+    """当前请求中通过 identity map 省掉的查询次数"""
+    if not has_request_context():
+        return 0
+    return g.get("mongo_identity_map_hits", 0)
+
+
+def invalidate(col_name):
+    if has_request_context() and "mongo_identity_map" in g:
+        with __lock:
+            g.mongo_identity_map.pop(col_name, None)
+
+
+def get_filter_id(filter):
+    """filter 只按 _id 查询（可带 _deleted: None）时返回 _id，否则返回 MISSING"""
+    if not filter or "_id" not in filter:
+        return MISSING
+    for key, value in filter.items():
+        if key == "_deleted" and value is None:
+            continue
+        if key != "_id":
+            return MISSING
+    _id = filter["_id"]
+    if isinstance(_id, (dict, list)):
+        return MISSING
+    return _id
+
+
+def lookup(identity_map, filter):
+    """
+    在 identity map 中查找 filter 对应的文档，未加载过返回 MISSING，
+    加载过但不存在或已被软删除（filter 中带 _deleted: None）时返回 None
+    """
+    _id = get_filter_id(filter)
+    if _id is MISSING or _id not in identity_map:
+        return MISSING
+    data = identity_map[_id]
+    if data and "_deleted" in filter and data.get("_deleted") is not None:
+        return None
+    return data
@@ -0,0 +1,114 @@
+import logging
+import random
+
+from utils.background_writer import BackgroundWriter
+
+
+class BatchingQueueHandler(logging.Handler):
+    """
+    非阻塞的日志 handler：请求线程只把 LogRecord 放入 BackgroundWriter 的有界队列，由后台线程格式化并批量写入 targets。
+    StreamHandler / FileHandler 每批只 write + flush 一次，其他 handler 逐条调用 handle。
+    队列积压超过 high_watermark 时，低于 WARNING 的记录按 overflow 处理：
+    drop 直接丢弃，sample 按 sample_rate 采样保留；队列满时所有记录都丢弃并计数
+    """
+
+    def __init__(
+        self,
+        targets,
+        queue_size=10000,
+        batch_size=200,
+        flush_interval=0.5,
+        overflow="drop",
+        sample_rate=0.1,
+        high_watermark=0.8,
+    ):
+        super().__init__()
+        self.targets = list(targets)
+        self.overflow = overflow
+        self.sample_rate = sample_rate
+        self.high_watermark = int(queue_size * high_watermark)
+        self.sampled_out = 0
+        self._writer = BackgroundWriter(
+            self._write,
+            "log-writer",
+            queue_size=queue_size,
+            batch_size=batch_size,
+            idle_interval=flush_interval,
+        )
+
+    def handle(self, record):
+        # emit 只做入队，不需要获取 Handler 的锁
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record):
+        if len(self._writer) >= self.high_watermark and record.levelno < logging.WARNING:
+            if self.overflow != "sample" or random.random() >= self.sample_rate:
+                self.sampled_out += 1
+                return
+        self._writer.put(record)
+
+    def _write(self, records):
+        for target in self.targets:
+            try:
+                matched = [
+                    record
+                    for record in records
+                    if record.levelno >= target.level and target.filter(record)
+                ]
+                if not matched:
+                    continue
+                if isinstance(target, logging.StreamHandler):
+                    text = "".join(target.format(record) + target.terminator for record in matched)
+                    target.acquire()
+                    try:
+                        target.stream.write(text)
+                        target.flush()
+                    finally:
+                        target.release()
+                else:
+                    for record in matched:
+                        target.handle(record)
+            except Exception:
+                # 和 logging.Handler.handleError 一致，日志写入失败不能影响业务
+                target.handleError(records[0])
+
+    def flush(self, timeout=5):
+        """等待调用之前进入队列的记录全部写出，最多等待 timeout 秒；logging.shutdown 退出时也会调用"""
+        self._writer.flush(timeout)
+
+    def stats(self):
+        return {
+            "queued": len(self._writer),
+            "dropped": self._writer.dropped,
+            "sampled_out": self.sampled_out,
+        }
+
+
+def install_queue_logging(loggers, config, section="LOGGING"):
+    """
+    把 loggers 现有的 handler 换成同一个 BatchingQueueHandler，原 handler 由后台线程写入。
+    没有开启时返回 None，保持同步写入
+    """
+    if not config.getboolean(section, "QUEUE_ENABLED", fallback=False):
+        return None
+
+    targets = []
+    for logger in loggers:
+        for handler in logger.handlers:
+            if handler not in targets:
+                targets.append(handler)
+    handler = BatchingQueueHandler(
+        targets,
+        queue_size=config.getint(section, "QUEUE_SIZE", fallback=10000),
+        batch_size=config.getint(section, "BATCH_SIZE", fallback=200),
+        flush_interval=config.getfloat(section, "FLUSH_INTERVAL", fallback=0.5),
+        overflow=config.get(section, "OVERFLOW", fallback="drop"),
+        sample_rate=config.getfloat(section, "SAMPLE_RATE", fallback=0.1),
+        high_watermark=config.getfloat(section, "HIGH_WATERMARK", fallback=0.8),
+    )
+    for logger in loggers:
+        logger.handlers = [handler]
+    return handler
@@ -0,0 +1,234 @@
+import os
+import shutil
+import time
+from contextvars import ContextVar
+
+from flask import g, request
+from pymongo import monitoring
+
+# prometheus_client 在导入时根据 PROMETHEUS_MULTIPROC_DIR 决定是否使用多进程模式，
+# 所以只在 init_metrics 设置好环境变量之后才导入
+MULTIPROC_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+# 没有匹配到路由的请求（404 等）统一使用该标签，避免任意 url 造成标签爆炸
+UNMATCHED_ROUTE = "<unmatched>"
+
+_request_start = ContextVar("metrics_request_start", default=None)
+__metrics = None
+
+
+def get_multiproc_dir(config, section="METRICS"):
+    return config.get(section, "MULTIPROC_DIR", fallback="")
+
+
+def clear_multiproc_dir(path):
+    """gunicorn master 启动时清空上次运行留下的 worker 指标文件"""
+    if path and os.path.isdir(path):
+        shutil.rmtree(path)
+    if path:
+        os.makedirs(path, exist_ok=True)
+
+
+def mark_process_dead(pid):
+    """gunicorn worker 退出时调用，去掉该 worker 的 livesum gauge"""
+    if os.environ.get(MULTIPROC_ENV):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid)
+
+
+class Metrics(object):
+    """所有指标，多进程模式下每个 worker 写自己的 mmap 文件，/metrics 读取时合并"""
+
+    def __init__(self):
+        from prometheus_client import Counter, Gauge, Histogram
+
+        self.request_latency = Histogram(
+            "http_request_duration_seconds",
+            "HTTP request latency by route",
+            ["method", "route"],
+        )
+        self.requests = Counter(
+            "http_requests_total",
+            "HTTP requests by route and status",
+            ["method", "route", "status"],
+        )
+        self.in_progress = Gauge(
+            "http_requests_in_progress",
+            "HTTP requests being handled",
+            multiprocess_mode="livesum",
+        )
+        self.mongo_latency = Histogram(
+            "mongo_command_duration_seconds",
+            "MongoDB command latency by collection and command",
+            ["collection", "command"],
+            buckets=MONGO_BUCKETS,
+        )
+        self.mongo_failures = Counter(
+            "mongo_command_failures_total",
+            "Failed MongoDB commands by collection and command",
+            ["collection", "command"],
+        )
+        self.pool_connections = Gauge(
+            "mongo_pool_connections",
+            "Open MongoDB connections",
+            multiprocess_mode="livesum",
+        )
+        self.pool_in_use = Gauge(
+            "mongo_pool_connections_in_use",
+            "MongoDB connections checked out",
+            multiprocess_mode="livesum",
+        )
+        self.pool_checkout_failures = Counter(
+            "mongo_pool_checkout_failures_total",
+            "Failed MongoDB connection checkouts",
+        )
+
+    def init_routes(self, app):
+        """为启动时注册的所有路由创建指标，没有请求过的路由也会以 0 出现"""
+        for rule in app.url_map.iter_rules():
+            for method in rule.methods - {"HEAD", "OPTIONS"}:
+                self.request_latency.labels(method, rule.rule)
+
+
+class MetricsCommandListener(monitoring.CommandListener):
+    """mongo 命令耗时直方图，succeeded/failed 事件中没有命令内容，collection 在 started 时记下"""
+
+    def __init__(self, metrics, max_pending=10000):
+        self.metrics = metrics
+        self.max_pending = max_pending
+        self._collections = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        if len(self._collections) >= self.max_pending:
+            # 没有收到结束事件的命令不能无限累积
+            self._collections.clear()
+        self._collections[event.request_id] = collection
+
+    def _observe(self, event):
+        collection = self._collections.pop(event.request_id, "")
+        self.metrics.mongo_latency.labels(collection, event.command_name).observe(
+            event.duration_micros / 1e6
+        )
+        return collection
+
+    def succeeded(self, event):
+        self._observe(event)
+
+    def failed(self, event):
+        collection = self._observe(event)
+        self.metrics.mongo_failures.labels(collection, event.command_name).inc()
+
+
+class MetricsPoolListener(monitoring.ConnectionPoolListener):
+    """连接池的连接数和使用中的连接数，gauge 在各个 worker 之间求和"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def pool_created(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.metrics.pool_connections.inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.metrics.pool_connections.dec()
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self.metrics.pool_checkout_failures.inc()
+
+    def connection_checked_out(self, event):
+        self.metrics.pool_in_use.inc()
+
+    def connection_checked_in(self, event):
+        self.metrics.pool_in_use.dec()
+
+
+def init_metrics(config, section="METRICS"):
+    """
+    创建指标并注册 mongo 监听器，需要在创建 MongoClient 之前调用。
+    配置了 MULTIPROC_DIR 时使用 prometheus_client 的多进程模式（gunicorn 多 worker）
+    """
+    global __metrics
+    if not config.getboolean(section, "ENABLED", fallback=False):
+        return None
+
+    multiproc_dir = get_multiproc_dir(config, section)
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+        os.environ[MULTIPROC_ENV] = multiproc_dir
+
+    __metrics = Metrics()
+    monitoring.register(MetricsCommandListener(__metrics))
+    monitoring.register(MetricsPoolListener(__metrics))
+    return __metrics
+
+
+def get_metrics():
+    return __metrics
+
+
+def register_metrics(app):
+    """记录每个请求的耗时、状态和进行中的请求数，需要在注册完所有路由之后调用"""
+    metrics = get_metrics()
+    if metrics is None:
+        return None
+
+    metrics.init_routes(app)
+
+    @app.before_request
+    def before_request_metrics():
+        metrics.in_progress.inc()
+        _request_start.set(time.perf_counter())
+
+    @app.after_request
+    def after_request_metrics(response):
+        start_time = _request_start.get()
+        # dev_toolbar 会对包装后的响应再执行一遍 after_request，同一个请求只统计一次
+        if start_time is not None and not g.get("metrics_observed"):
+            g.metrics_observed = True
+            route = request.url_rule.rule if request.url_rule else UNMATCHED_ROUTE
+            metrics.request_latency.labels(request.method, route).observe(
+                time.perf_counter() - start_time
+            )
+            metrics.requests.labels(request.method, route, response.status_code).inc()
+        return response
+
+    @app.teardown_request
+    def teardown_request_metrics(exc):
+        # 出现异常时 after_request 不一定执行，进行中的请求数在这里减
+        if _request_start.get() is not None:
+            _request_start.set(None)
+            metrics.in_progress.dec()
+
+    return metrics
+
+
+def render_metrics():
+    """返回 (Prometheus 文本格式, content type)，多进程模式下合并所有 worker 的指标"""
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+
+    registry = REGISTRY
+    if os.environ.get(MULTIPROC_ENV):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+
+import bson
+
+# 缓存未命中的标记，区分“没有缓存”和“缓存了 None”
+MISSING = object()
+
+
+class LRUCache(object):
+    """
+    带 TTL 的定长 LRU 缓存，线程安全，记录命中/未命中/淘汰次数。
+    每次 clear 时 generation 加一：查询前记下 generation，set 时不一致说明查询期间有写入，
+    查到的可能是写入前的旧数据，不再放入缓存。
+    缓存中保存的是 BSON 编码后的 bytes，每次命中都解码出新的对象，调用方修改返回值不会影响缓存
+    （pymongo 查到的文档本身就是从 BSON 解码的，编码再解码后类型不变）
+    """
+
+    def __init__(self, max_size=1000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.generation = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key, MISSING)
+            if item is MISSING:
+                self.misses += 1
+                return MISSING
+
+            expire_time, value = item
+            if expire_time < time.time():
+                del self._data[key]
+                self.evictions += 1
+                self.misses += 1
+                return MISSING
+
+            self._data.move_to_end(key)
+            self.hits += 1
+        return bson.decode(value)["v"]
+
+    def set(self, key, value, generation=None):
+        value = bson.encode({"v": value})
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (time.time() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.generation += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# collection 名 -> LRUCache，同一个 collection 的多个 model 共用一份缓存，写入时一起失效
+__caches = {}
+__caches_lock = threading.Lock()
+
+
+def get_cache(col_name, options):
+    cache = __caches.get(col_name)
+    if cache is None:
+        with __caches_lock:
+            cache = __caches.get(col_name)
+            if cache is None:
+                cache = LRUCache(
+                    max_size=options.get("max_size", 1000), ttl=options.get("ttl", 60)
+                )
+                __caches[col_name] = cache
+    return cache
+
+
+def invalidate(col_name):
+    cache = __caches.get(col_name)
+    if cache is not None:
+        cache.clear()
+
+
+def make_key(method, *args):
+    """缓存 key：查询方法 + filter/projection/sort 等参数的 repr"""
+    return repr((method,) + args)
+
+
+def all_stats():
+    return {col_name: cache.stats() for col_name, cache in list(__caches.items())}
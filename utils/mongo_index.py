@@ -0,0 +1,111 @@
+import importlib
+import logging
+import pkgutil
+import time
+
+from pymongo import IndexModel
+
+# 需要和已有索引比较是否一致的选项
+COMPARED_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+
+def index(keys, name=None, unique=False, partial=None, ttl=None, **kwargs):
+    """
+    声明索引，用于 model 的 __indexes__：
+
+        class Task(MongoBase):
+            __indexes__ = [
+                index([("status", 1), ("create_time", -1)], partial={"status": {"$exists": True}}),
+                index([("expire_time", 1)], ttl=0),
+            ]
+
+    partial 为 partialFilterExpression，ttl 为 expireAfterSeconds
+    """
+    if isinstance(keys, str):
+        keys = [(keys, 1)]
+    if name:
+        kwargs["name"] = name
+    if unique:
+        kwargs["unique"] = True
+    if partial:
+        kwargs["partialFilterExpression"] = partial
+    if ttl is not None:
+        kwargs["expireAfterSeconds"] = ttl
+    return IndexModel(keys, **kwargs)
+
+
+def get_index_diff(declared, existing):
+    """比较声明的索引与已有索引，返回不一致的选项说明，一致时返回空字符串"""
+    if list(declared["key"].items()) != [tuple(it) for it in existing["key"]]:
+        return f"key {list(declared['key'].items())} != {existing['key']}"
+    for option in COMPARED_OPTIONS:
+        if declared.get(option) != existing.get(option):
+            return f"{option} {declared.get(option)} != {existing.get(option)}"
+    return ""
+
+
+def sync_indexes(model):
+    """
+    创建 model 声明但不存在的索引（一次 createIndexes），已存在的检查是否一致。
+    不会删除或修改已有索引，不一致的需要人工处理
+    """
+    start_time = time.time()
+    col_name = model.get_collection_name()
+    report = {"collection": col_name, "created": [], "existing": [], "mismatched": []}
+    if not model.__indexes__:
+        return report
+
+    col = model.get_collection()
+    existing = col.index_information()
+    missing = []
+    for declared_index in model.__indexes__:
+        declared = declared_index.document
+        name = declared["name"]
+        if name not in existing:
+            missing.append(declared_index)
+            continue
+        diff = get_index_diff(declared, existing[name])
+        if diff:
+            report["mismatched"].append({"name": name, "diff": diff})
+        else:
+            report["existing"].append(name)
+
+    if missing:
+        report["created"] = col.create_indexes(missing)
+
+    log_func = logging.warning if report["mismatched"] else logging.info
+    log_func(
+        "sync indexes of %s in %.3f seconds, created %s, mismatched %s",
+        col_name,
+        time.time() - start_time,
+        report["created"],
+        report["mismatched"],
+    )
+    return report
+
+
+def iter_models(base):
+    """base 的所有已导入子类，同一个 collection 只返回第一个"""
+    seen = set()
+    stack = list(base.__subclasses__())
+    while stack:
+        model = stack.pop(0)
+        stack.extend(model.__subclasses__())
+        col_name = model.get_collection_name()
+        if col_name in seen or not model.__indexes__:
+            continue
+        seen.add(col_name)
+        yield model
+
+
+def import_models(package_name="models"):
+    """导入 package_name 下的所有 model 模块，懒加载蓝图时 model 不一定在启动时被导入"""
+    package = importlib.import_module(package_name)
+    for module in pkgutil.iter_modules(package.__path__):
+        importlib.import_module(f"{package_name}.{module.name}")
+
+
+def sync_all_indexes(base, package_name="models"):
+    if package_name:
+        import_models(package_name)
+    return [sync_indexes(model) for model in iter_models(base)]
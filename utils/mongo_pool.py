@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+
+from pymongo import monitoring
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """统计当前进程（gunicorn worker）连接池的使用情况和取连接的等待时间"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 取连接是同步的，开始和结束事件在同一个线程中触发
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.pid = os.getpid()
+            self.connections = 0
+            self.in_use = 0
+            self.max_in_use = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.wait_time_total = 0.0
+            self.wait_time_max = 0.0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections -= 1
+
+    def connection_check_out_started(self, event):
+        self._local.start_time = time.time()
+
+    def _wait_time(self):
+        start_time = getattr(self._local, "start_time", None)
+        self._local.start_time = None
+        return time.time() - start_time if start_time else 0.0
+
+    def connection_check_out_failed(self, event):
+        wait_time = self._wait_time()
+        with self._lock:
+            self.checkout_failures += 1
+            self.wait_time_total += wait_time
+            self.wait_time_max = max(self.wait_time_max, wait_time)
+
+    def connection_checked_out(self, event):
+        wait_time = self._wait_time()
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+            self.wait_time_total += wait_time
+            self.wait_time_max = max(self.wait_time_max, wait_time)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pid": self.pid,
+                "connections": self.connections,
+                "in_use": self.in_use,
+                "max_in_use": self.max_in_use,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "wait_time_avg_ms": self.wait_time_total
+                / max(self.checkouts + self.checkout_failures, 1)
+                * 1000,
+                "wait_time_max_ms": self.wait_time_max * 1000,
+            }
+
+
+def get_client_options(config, section="DB_POOL"):
+    """从 config.properties 读取 MongoClient 连接池参数，未配置的使用 pymongo 默认值"""
+    options = {}
+    if not config.has_section(section):
+        return options
+
+    int_options = {
+        "MAX_POOL_SIZE": "maxPoolSize",
+        "MIN_POOL_SIZE": "minPoolSize",
+        "WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+        "MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+        "SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+    }
+    for key, option in int_options.items():
+        value = config.get(section, key, fallback="").strip()
+        if value:
+            options[option] = int(value)
+
+    compressors = config.get(section, "COMPRESSORS", fallback="").strip()
+    if compressors:
+        options["compressors"] = compressors
+    return options
@@ -1,29 +1,336 @@
+import base64
 import datetime
 import logging
 import time
+import bson
 import pymongo
 import os
+import threading
 import configparser
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import bson.raw_bson
+from pymongo.errors import BulkWriteError
+from pydash import py_
 
 from utils.wrapper import get_json_result
+from utils import mongo_cache
+from utils import identity_map
+from utils import batch_loader
+from utils import mongo_index
+from utils.mongo_pool import PoolStatsListener, get_client_options
 
 
 __db = None
+__db_pid = None
+# 服务端是否支持聚合管道形式的 update（MongoDB 4.2+），每个 client 检查一次
+__pipeline_update = None
+pool_listener = PoolStatsListener()
+
+# 自增 id 的本地号段：collection 名 -> [下一个可用 id, 号段内最大 id]
+__id_blocks = {}
+# collection 名 -> 该 collection 号段的锁，不同 collection 分配 id 互不等待
+__id_locks = {}
+__id_locks_lock = threading.Lock()
+
+# update 分页/逐条更新模式下每次 bulk_write 的文档数
+UPDATE_BATCH_SIZE = 500
 
 config = configparser.ConfigParser()
 config.read(os.path.join(os.path.dirname(__file__), "../", "config.properties"))
 
 
 def db():
-    global __db
-    if not __db:
-        db_client = pymongo.MongoClient(config["SERVER_INFO"]["DB_SERVER"])
+    global __db, __db_pid, __pipeline_update
+    # gunicorn --preload 时 master 进程创建的 client 会被 fork 到 worker，MongoClient 不是 fork 安全的，
+    # pid 变化后在子进程中重新创建
+    if not __db or __db_pid != os.getpid():
+        db_client = pymongo.MongoClient(
+            config["SERVER_INFO"]["DB_SERVER"],
+            event_listeners=[pool_listener],
+            **get_client_options(config)
+        )
         db_name = config["SERVER_INFO"]["DB_NAME"]
         __db = db_client[db_name]
+        __db_pid = os.getpid()
+        __pipeline_update = None
     return __db
 
 
+def reset_db_after_fork():
+    global __db
+    __db = None
+    pool_listener.reset()
+    # 父进程预留的号段不能在多个 worker 中重复发放；fork 时被其他线程持有的锁在子进程中不会释放
+    __id_blocks.clear()
+    __id_locks.clear()
+
+
+def get_id_lock(name):
+    lock = __id_locks.get(name)
+    if lock is None:
+        with __id_locks_lock:
+            lock = __id_locks.setdefault(name, threading.Lock())
+    return lock
+
+
+def inc_ids(name, size):
+    """向 ids 表预留 size 个 id，返回预留的最大 id"""
+    item = db()["ids"].find_one_and_update(
+        {"name": name},
+        {"$inc": {"id": size}},
+        upsert=True,
+        return_document=pymongo.ReturnDocument.AFTER,
+    )
+    return item["id"]
+
+
+def allocate_ids(name, n, block_size=1):
+    """
+    hi/lo 方式分配自增 id：每次通过一次 $inc 向 ids 表预留 block_size 个 id 放在本地号段中，
+    用完后再预留下一段。进程重启时未用完的号段会被丢弃，id 不保证连续。
+    block_size 为 1 时没有本地号段，直接 $inc，不加锁
+    """
+    if block_size <= 1:
+        high = inc_ids(name, n)
+        return list(range(high - n + 1, high + 1))
+
+    ids = []
+    with get_id_lock(name):
+        block = __id_blocks.get(name)
+        if block and block[0] <= block[1]:
+            count = min(n, block[1] - block[0] + 1)
+            ids.extend(range(block[0], block[0] + count))
+            block[0] += count
+
+        needed = n - len(ids)
+        if needed > 0:
+            size = max(needed, block_size)
+            high = inc_ids(name, size)
+            low = high - size + 1
+            ids.extend(range(low, low + needed))
+            __id_blocks[name] = [low + needed, high]
+    return ids
+
+
+def reset_ids(name, id):
+    """
+    重置自增 id，同时丢弃本进程未用完的号段，之后的 id 从新值开始分配。
+    其他进程已预留的号段不受影响，会继续发放到用完为止
+    """
+    with get_id_lock(name):
+        item = db()["ids"].find_one_and_update(
+            {"name": name},
+            {"$set": {"id": id}},
+            upsert=True,
+            return_document=pymongo.ReturnDocument.AFTER,
+        )
+        __id_blocks.pop(name, None)
+    return item["id"]
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_db_after_fork)
+
+
+def encode_page_cursor(sort_keys, values):
+    """把最后一条数据的排序字段值编码为不透明的分页游标，bson 编码保留 ObjectId/datetime 类型"""
+    data = bson.encode({"k": sort_keys, "v": values})
+    return base64.urlsafe_b64encode(data).decode("ascii")
+
+
+def decode_page_cursor(sort_keys, cursor):
+    try:
+        data = bson.decode(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("invalid page cursor: {}".format(cursor))
+    if data.get("k") != sort_keys:
+        raise ValueError("page cursor does not match sort: {}".format(sort_keys))
+    return data["v"]
+
+
+def get_keyset_filter(sort, values):
+    """
+    生成 keyset 条件：排序为 [(a, 1), (_id, 1)] 时为
+    {"$or": [{"a": {"$gt": va}}, {"a": va, "_id": {"$gt": vid}}]}
+    """
+    conditions = []
+    for i, (key, direction) in enumerate(sort):
+        condition = {sort[j][0]: values[j] for j in range(i)}
+        condition[key] = {"$gt" if direction > 0 else "$lt": values[i]}
+        conditions.append(condition)
+    return {"$or": conditions}
+
+
+def has_update_time(update):
+    """调用方已经在 update 中处理了 update_time"""
+    if isinstance(update, list):
+        return any("update_time" in stage.get("$set", {}) for stage in update)
+    return any(
+        isinstance(value, dict) and "update_time" in value for value in update.values()
+    )
+
+
+def get_update_time_pipeline(update, update_time):
+    """
+    只包含顶层字段 $set/$unset 的 update 转为聚合管道，字段值实际变化时才写入 update_time：
+    没有变化的文档不会被修改，nModified 和先更新、有修改再补写 update_time 的两次写入一致。
+    其他形式返回 None
+    """
+    if not isinstance(update, dict) or not update or set(update) - {"$set", "$unset"}:
+        return None
+    set_fields = update.get("$set") or {}
+    unset_fields = list(update.get("$unset") or {})
+    fields = list(set_fields) + unset_fields
+    if not fields or any("." in it or it.startswith("$") for it in fields):
+        return None
+
+    # $ne 认为 1 和 1.0 相等、不存在和 null 相等，同时比较 BSON 类型，只改类型也算修改
+    changed = []
+    for k, v in set_fields.items():
+        changed.append({"$ne": ["$" + k, {"$literal": v}]})
+        changed.append({"$ne": [{"$type": "$" + k}, {"$type": {"$literal": v}}]})
+    changed += [{"$ne": [{"$type": "$" + k}, "missing"]} for k in unset_fields]
+    # 没有变化时 update_time 取原值，原来没有该字段时结果为 missing，不会新增字段
+    pipeline = [
+        {
+            "$set": {
+                "update_time": {"$cond": [{"$or": changed}, update_time, "$update_time"]}
+            }
+        }
+    ]
+    if set_fields:
+        pipeline.append({"$set": {k: {"$literal": v} for k, v in set_fields.items()}})
+    if unset_fields:
+        pipeline.append({"$unset": unset_fields})
+    return pipeline
+
+
+def get_update_fields(update):
+    """update 会修改的顶层字段，替换文档或管道中有 $set/$unset 以外的阶段时无法确定，返回 None"""
+    fields = set()
+    if isinstance(update, list):
+        for stage in update:
+            for op, spec in stage.items():
+                if op in ("$set", "$addFields"):
+                    fields.update(spec)
+                elif op == "$unset":
+                    fields.update([spec] if isinstance(spec, str) else spec)
+                else:
+                    return None
+    else:
+        for op, spec in update.items():
+            if not op.startswith("$") or not isinstance(spec, dict):
+                return None
+            fields.update(spec)
+            if op == "$rename":
+                fields.update(spec.values())
+    return sorted({it.split(".")[0] for it in fields})
+
+
+def get_field_snapshot(doc, fields):
+    """文档中 fields 的 BSON 编码，用于比较更新前后是否变化（区分 1 和 1.0、不存在和 null）"""
+    if fields is None:
+        return bson.encode({k: v for k, v in doc.items() if k != "update_time"})
+    return bson.encode({k: doc[k] for k in fields if k in doc})
+
+
+def supports_pipeline_update():
+    global __pipeline_update
+    if __pipeline_update is None:
+        version = db().client.server_info().get("versionArray", [0])
+        __pipeline_update = list(version[:2]) >= [4, 2]
+    return __pipeline_update
+
+
+def disable_pipeline_update():
+    # mongomock 等不支持管道 update 的 client，参数校验时抛出 TypeError，此时还没有写入
+    global __pipeline_update
+    __pipeline_update = False
+
+
+def update_with_time(col, filter, update, update_time=None, upsert=False, multi=False):
+    """
+    执行 update，文档实际被修改时写入 update_time，返回 UpdateResult。
+    能转为管道时一次写入完成；其他形式或服务端不支持时和原来一样先更新，有修改再补写 update_time
+    """
+    update_time = update_time or datetime.datetime.now()
+    write = col.update_many if multi else col.update_one
+    if has_update_time(update):
+        return write(filter, update, upsert=upsert)
+
+    pipeline = get_update_time_pipeline(update, update_time)
+    if pipeline is not None and supports_pipeline_update():
+        try:
+            return write(filter, pipeline, upsert=upsert)
+        except TypeError:
+            disable_pipeline_update()
+
+    result = write(filter, update, upsert=upsert)
+    if result.modified_count > 0:
+        write(filter, {"$set": {"update_time": update_time}})
+    return result
+
+
+def get_insert_param(kwargs, create_time):
+    """insert_many 的文档清洗：去掉 _ 开头和不支持类型的字段，id 转为 _id"""
+    param = {"create_time": create_time}
+    for attr_name, attr_value in kwargs.items():
+        if attr_name.startswith("_"):
+            continue
+        if type(attr_value).__name__ not in [
+            "int",
+            "str",
+            "float",
+            "list",
+            "dict",
+            "bool",
+            "datetime",
+        ]:
+            continue
+        if attr_name == "id":
+            attr_name = "_id"
+        param[attr_name] = attr_value
+    return param
+
+
+def iter_insert_chunks(data, create_time, batch_size, max_batch_bytes):
+    """
+    把任意可迭代对象按文档数和 BSON 字节数切分为批次。
+    每个文档只编码一次，以 RawBSONDocument 交给 pymongo，不会再重复编码
+    """
+    chunk = []
+    chunk_bytes = 0
+    for kwargs in data:
+        param = get_insert_param(kwargs, create_time)
+        # RawBSONDocument 不能由 pymongo 补 _id，需要提前生成
+        if "_id" not in param:
+            param["_id"] = bson.ObjectId()
+        raw = bson.raw_bson.RawBSONDocument(bson.encode(param))
+        if chunk and (
+            len(chunk) >= batch_size or chunk_bytes + len(raw.raw) > max_batch_bytes
+        ):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(raw)
+        chunk_bytes += len(raw.raw)
+    if chunk:
+        yield chunk
+
+
 class MongoBase(object):
+    # 读缓存配置，默认关闭。开启示例：__cache__ = {"max_size": 1000, "ttl": 60}
+    # 缓存按进程隔离，通过本类 insert*/update*/upsert/delete 写入时整个 collection 失效，
+    # 其他进程或直接操作 get_collection() 的写入只能依赖 ttl 过期；缓存中保存的是 BSON，每次命中返回新的对象
+    __cache__ = None
+    # get_auto_increasing_id 每次向 ids 表预留的 id 个数，大于 1 时批量导入不再每条都访问 ids 表
+    __id_block_size__ = 1
+    # 开启后同一个请求内按 _id 重复的 find_one/find 复用已加载的文档，写入该 collection 时失效；
+    # 复用的是同一个对象，不要修改
+    __identity_map__ = False
+    # 声明的索引，pymongo.IndexModel 列表，通常用 utils.mongo_index.index 生成，通过 sync_indexes 创建
+    __indexes__ = []
+
     @classmethod
     def insert_obj(cls, data):
         start_time = time.time()
@@ -38,6 +345,7 @@ class MongoBase(object):
         except Exception as ex:
             error = ex
             log_func = logging.error
+        cls.invalidate_cache()
         log_func(
             "insert into %s in %.3f seconds, error is %s",
             col_name,
@@ -86,6 +394,7 @@ class MongoBase(object):
         except Exception as ex:
             error = ex
             log_func = logging.error
+        cls.invalidate_cache()
         log_func(
             "insert into %s in %.3f seconds, error is %s",
             col_name,
@@ -100,27 +409,7 @@ class MongoBase(object):
     def insert_many(cls, data, ordered=True):
         start_time = time.time()
         create_time = datetime.datetime.now()
-        params = []
-
-        for kwargs in data:
-            param = {"create_time": create_time}
-            for attr_name, attr_value in kwargs.items():
-                if attr_name.startswith("_"):
-                    continue
-                if type(attr_value).__name__ not in [
-                    "int",
-                    "str",
-                    "float",
-                    "list",
-                    "dict",
-                    "bool",
-                    "datetime",
-                ]:
-                    continue
-                if attr_name == "id":
-                    attr_name = "_id"
-                param[attr_name] = attr_value
-            params.append(param)
+        params = [get_insert_param(kwargs, create_time) for kwargs in data]
 
         # insert data
         col_name = cls.get_collection_name()
@@ -132,11 +421,85 @@ class MongoBase(object):
         except Exception as ex:
             error = ex
             log_func = logging.error
+        cls.invalidate_cache()
         log_func(
             "insert %d docs into %s in %.3f seconds, error is %s",
-            len(data),
+            len(params),
+            col_name,
+            time.time() - start_time,
+            repr(error) if error else "",
+        )
+        if error:
+            raise error
+        return result
+
+    @classmethod
+    def insert_stream(
+        cls,
+        data,
+        ordered=True,
+        batch_size=1000,
+        max_batch_bytes=8 * 1024 * 1024,
+        workers=1,
+    ):
+        """
+        流式批量插入，data 可以是生成器等任意可迭代对象，内存中最多保留 workers * 2 个批次。
+        ordered=False 且 workers > 1 时多个批次并发写入。
+        返回 {"nInserted": 插入条数, "errors": [writeErrors...]}，ordered=True 时遇到错误即停止
+        """
+        start_time = time.time()
+        create_time = datetime.datetime.now()
+        col_name = cls.get_collection_name()
+        col = db()[col_name]
+        result = {"nInserted": 0, "errors": []}
+        error = ""
+        log_func = logging.debug
+
+        def insert_chunk(chunk):
+            try:
+                # RawBSONDocument 的 _id 不会出现在 inserted_ids 中，成功时整批都已写入
+                col.insert_many(chunk, ordered=ordered)
+                return len(chunk), []
+            except BulkWriteError as ex:
+                return ex.details.get("nInserted", 0), ex.details.get("writeErrors", [])
+
+        chunks = iter_insert_chunks(data, create_time, batch_size, max_batch_bytes)
+        try:
+            if ordered or workers <= 1:
+                for chunk in chunks:
+                    inserted, errors = insert_chunk(chunk)
+                    result["nInserted"] += inserted
+                    result["errors"].extend(errors)
+                    if errors and ordered:
+                        break
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    pending = set()
+                    for chunk in chunks:
+                        pending.add(executor.submit(insert_chunk, chunk))
+                        # 限制在途批次数量，避免生成器读得比写得快导致内存上涨
+                        if len(pending) >= workers * 2:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                inserted, errors = future.result()
+                                result["nInserted"] += inserted
+                                result["errors"].extend(errors)
+                    for future in pending:
+                        inserted, errors = future.result()
+                        result["nInserted"] += inserted
+                        result["errors"].extend(errors)
+        except Exception as ex:
+            error = ex
+            log_func = logging.error
+        cls.invalidate_cache()
+        if result["errors"]:
+            log_func = logging.error
+        log_func(
+            "insert stream %d docs into %s in %.3f seconds, %d write errors, error is %s",
+            result["nInserted"],
             col_name,
             time.time() - start_time,
+            len(result["errors"]),
             repr(error) if error else "",
         )
         if error:
@@ -161,49 +524,69 @@ class MongoBase(object):
         page_size=-1,
         is_update_time=True,
         is_use_single_update=False,
+        batch_size=UPDATE_BATCH_SIZE,
     ):
         start_time = time.time()
         error = ""
         log_func = logging.debug
         result = 0
         updated = 0
+        # mongo 的时间精度是毫秒，截断后才能用 update_time 反查本次修改的文档
+        update_time = datetime.datetime.now()
+        update_time = update_time.replace(
+            microsecond=update_time.microsecond // 1000 * 1000
+        )
 
         # update
         col_name = cls.get_collection_name()
         try:
             if skip_count > 0 or page_size > 0 or is_use_single_update:
-                cursor = cls.find(
-                    filter,
-                    return_cursor=True,
-                    skip_count=skip_count,
-                    page_size=page_size,
+                # 原有的 update_time 用于避开和本次写入相同的时间，update 修改的字段用于比较哪些文档被修改，
+                # 见 _bulk_update_by_ids；无法确定修改的字段时取整个文档
+                update_fields = get_update_fields(update)
+                fields = (
+                    None
+                    if update_fields is None
+                    else dict.fromkeys(["_id", "update_time"] + update_fields, 1)
                 )
+                if skip_count > 0:
+                    cursor = cls.find(
+                        filter,
+                        return_cursor=True,
+                        fields=fields,
+                        skip_count=skip_count,
+                        page_size=page_size,
+                    )
+                else:
+                    # 按 _id 分批遍历，不用长时间持有 cursor，更新过程中文档不再匹配 filter 也不会漏数据
+                    cursor = cls.iter_find(
+                        filter, fields=fields, batch_size=batch_size, limit=page_size
+                    )
                 result = {"nModified": 0, "nModifiedData": []}
+                items = []
                 for item in cursor:
-                    filter_param = {"_id": item["_id"]}
-                    single_result = db()[col_name].update_one(filter_param, update)
-                    result["nModified"] += single_result.modified_count
-                    if single_result.modified_count > 0:
-                        result["nModifiedData"].append(item["_id"])
-                        if is_update_time:
-                            db()[col_name].update_one(
-                                filter_param,
-                                {"$set": {"update_time": datetime.datetime.now()}},
-                            )
+                    items.append(item)
+                    if len(items) >= batch_size:
+                        cls._bulk_update_by_ids(
+                            items, update, result, update_time if is_update_time else None
+                        )
+                        items = []
+                if items:
+                    cls._bulk_update_by_ids(
+                        items, update, result, update_time if is_update_time else None
+                    )
+            elif is_update_time:
+                result = update_with_time(
+                    db()[col_name], filter, update, update_time, multi=True
+                ).raw_result
             else:
                 result = db()[col_name].update(filter, update, multi=True)
-                # 下面的 update_time 并不能反映真实修改后的数据，有可能没有修改也会改到 update_time 字段
-                if result["nModified"] > 0 and is_update_time:
-                    db()[col_name].update(
-                        filter,
-                        {"$set": {"update_time": datetime.datetime.now()}},
-                        multi=True,
-                    )
 
             updated = result.get("nModified", 0)
         except Exception as ex:
             error = ex
             log_func = logging.error
+        cls.invalidate_cache()
 
         # logging
         log_func(
@@ -217,6 +600,68 @@ class MongoBase(object):
             raise error
         return result
 
+    @classmethod
+    def _bulk_update_by_ids(cls, items, update, result, update_time=None):
+        """
+        按 _id 执行同一个 update，一批只有一次 bulk_write，结果累加到 result 中，
+        nModified / nModifiedData 只包含实际修改的文档。items 为更新前的文档（至少包含 update 修改的字段）。
+        能转为管道时只有实际修改的文档会写入本次的 update_time，部分修改时通过 update_time 反查；
+        其他形式部分修改时重新读取这一批文档，和更新前比较找出修改的文档，再一次 update_many 写入 update_time
+        """
+        col = db()[cls.get_collection_name()]
+        ids = [it["_id"] for it in items]
+        stamp = update_time is not None and not has_update_time(update)
+        if stamp:
+            # 原来已经是同一毫秒 update_time 的文档无法区分是否被本次修改，换一个时间
+            existing = {it.get("update_time") for it in items}
+            while update_time in existing:
+                update_time += datetime.timedelta(milliseconds=1)
+            pipeline = get_update_time_pipeline(update, update_time)
+            if pipeline is not None and supports_pipeline_update():
+                try:
+                    bulk_result = col.bulk_write(
+                        [pymongo.UpdateOne({"_id": _id}, pipeline) for _id in ids],
+                        ordered=False,
+                    )
+                except TypeError:
+                    disable_pipeline_update()
+                else:
+                    modified = bulk_result.modified_count
+                    result["nModified"] += modified
+                    if modified >= len(ids):
+                        result["nModifiedData"].extend(ids)
+                    elif modified > 0:
+                        cursor = col.find(
+                            {"_id": {"$in": ids}, "update_time": update_time}, {"_id": 1}
+                        )
+                        result["nModifiedData"].extend(it["_id"] for it in cursor)
+                    return
+
+        bulk_result = col.bulk_write(
+            [pymongo.UpdateOne({"_id": _id}, update) for _id in ids], ordered=False
+        )
+        modified = bulk_result.modified_count
+        if modified >= len(ids):
+            modified_ids = ids
+        elif modified > 0:
+            fields = get_update_fields(update)
+            before = {it["_id"]: get_field_snapshot(it, fields) for it in items}
+            projection = None if fields is None else dict.fromkeys(["_id"] + fields, 1)
+            modified_ids = [
+                it["_id"]
+                for it in col.find({"_id": {"$in": ids}}, projection)
+                if get_field_snapshot(it, fields) != before.get(it["_id"])
+            ]
+        else:
+            modified_ids = []
+        if modified_ids and stamp:
+            col.update_many(
+                {"_id": {"$in": modified_ids}}, {"$set": {"update_time": update_time}}
+            )
+        # 只改了类型（1 -> 1.0）时不同版本的服务端计数不一致，以比较结果为准，和 nModifiedData 保持一致
+        result["nModified"] += len(modified_ids)
+        result["nModifiedData"].extend(modified_ids)
+
     @classmethod
     def update_one(
         cls, filter, update, upsert=False, is_update_time=True, print_log=True
@@ -230,15 +675,15 @@ class MongoBase(object):
         # update
         col_name = cls.get_collection_name()
         try:
-            result = db()[col_name].update_one(filter, update, upsert=upsert)
+            if is_update_time:
+                result = update_with_time(db()[col_name], filter, update, upsert=upsert)
+            else:
+                result = db()[col_name].update_one(filter, update, upsert=upsert)
             updated = result.modified_count
         except Exception as ex:
             error = ex
             log_func = logging.error
-
-        if updated > 0 and is_update_time:
-            update = {"$set": {"update_time": datetime.datetime.now()}}
-            db()[col_name].update_one(filter, update, upsert=upsert)
+        cls.invalidate_cache()
 
         # logging
         if print_log:
@@ -261,6 +706,27 @@ class MongoBase(object):
         log_func = logging.debug
         data = None
 
+        # 请求内 identity map，投影后的文档不完整，不放入也不读取
+        id_map = None if fields else cls.get_identity_map()
+        if id_map is not None:
+            data = identity_map.lookup(id_map, filter)
+            if data is not mongo_cache.MISSING:
+                identity_map.record_hit()
+                logging.debug("find one from %s hit identity map", col_name)
+                return get_json_result(data) if data and return_json else data
+
+        # 读缓存，缓存的是 get_json_result 之后的结果，命中时不再序列化
+        cache = cls.get_cache()
+        if cache:
+            cache_key = mongo_cache.make_key(
+                "find_one", col_name, filter, fields, sort, return_json
+            )
+            data = cache.get(cache_key)
+            if data is not mongo_cache.MISSING:
+                logging.debug("find one from %s hit cache", col_name)
+                return data
+            generation = cache.generation
+
         # query
         try:
             data = db()[col_name].find_one(
@@ -279,13 +745,20 @@ class MongoBase(object):
         if error:
             raise error
 
+        if id_map is not None:
+            if data:
+                id_map[data["_id"]] = data
+            elif identity_map.get_filter_id(filter) is not mongo_cache.MISSING:
+                id_map[identity_map.get_filter_id(filter)] = None
+
         # not found
         if not data:
-            return None
-
-        if return_json:
-            return get_json_result(data)
+            data = None
+        elif return_json:
+            data = get_json_result(data)
 
+        if cache:
+            cache.set(cache_key, data, generation)
         return data
 
     @classmethod
@@ -312,6 +785,30 @@ class MongoBase(object):
         try:
             if not is_include_deleted:
                 filter["_deleted"] = None
+
+            id_map = None if return_cursor or fields else cls.get_identity_map()
+            if id_map is not None and skip_count <= 0:
+                data = identity_map.lookup(id_map, filter)
+                if data is not mongo_cache.MISSING:
+                    identity_map.record_hit()
+                    data = [data] if data else []
+                    if return_json:
+                        data = get_json_result(data)
+                    count = len(data)
+                    return data
+
+            # 读缓存，返回 cursor 时不缓存
+            cache = None if return_cursor else cls.get_cache()
+            if cache:
+                cache_key = mongo_cache.make_key(
+                    "find", col_name, filter, fields, sort, skip_count, page_size, return_json
+                )
+                data = cache.get(cache_key)
+                if data is not mongo_cache.MISSING:
+                    count = len(data)
+                    return data
+                generation = cache.generation
+
             col = db()[col_name]
             if fields:
                 cursor = col.find(filter, fields)
@@ -328,10 +825,15 @@ class MongoBase(object):
                 return cursor
             else:
                 data = [it for it in cursor]
+                if id_map is not None:
+                    for it in data:
+                        id_map[it["_id"]] = it
 
                 if return_json:
                     data = get_json_result(data)
 
+                if cache:
+                    cache.set(cache_key, data, generation)
                 count = len(data)
                 return data
         except Exception as ex:
@@ -348,6 +850,134 @@ class MongoBase(object):
             if error:
                 raise error
 
+    @classmethod
+    def find_by_keys(
+        cls, keys, field="_id", fields=None, return_json=False, is_include_deleted=True
+    ):
+        """
+        一次 $in 查询按唯一字段批量获取文档，代替循环调用 find_one，
+        结果按 keys 的顺序返回，不存在的 key 为 None。
+        和 find_one 一样默认包含已软删除的文档，is_include_deleted=False 时已删除的 key 也为 None
+        """
+        keys = list(keys)
+        if not keys:
+            return []
+
+        # 投影中需要带上 field 才能按 key 对应结果
+        if isinstance(fields, dict) and any(fields.values()):
+            fields = dict(fields, **{field: 1})
+        elif isinstance(fields, (list, tuple)) and field not in fields:
+            fields = list(fields) + [field]
+
+        data = cls.find(
+            {field: {"$in": list(dict.fromkeys(keys))}},
+            fields=fields,
+            is_include_deleted=is_include_deleted,
+        )
+        data = batch_loader.order_by_keys(data, keys, field)
+        if return_json:
+            data = get_json_result(data)
+        return data
+
+    @classmethod
+    def loader(cls, field="_id", fields=None, return_json=False, is_include_deleted=True):
+        """DataLoader 风格的批量加载器，请求内按参数共用，见 utils.batch_loader.BatchLoader"""
+        return batch_loader.get_loader(
+            cls,
+            field=field,
+            fields=fields,
+            return_json=return_json,
+            is_include_deleted=is_include_deleted,
+        )
+
+    @classmethod
+    def find_page(
+        cls,
+        filter=None,
+        cursor=None,
+        page_size=20,
+        sort=None,
+        fields=None,
+        is_include_deleted=False,
+        return_json=False,
+    ):
+        """
+        keyset 分页，代替 skip_count 翻页，深分页时不需要扫描跳过的文档。
+        返回 {"data": [...], "next_cursor": "..."}，next_cursor 为 None 表示没有下一页，
+        把 next_cursor 原样传回 cursor 参数即可取下一页。排序字段需要非空，会自动追加 _id 保证唯一。
+        """
+        if isinstance(sort, str):
+            sort = [(sort, pymongo.ASCENDING)]
+        sort = list(sort or [])
+        if "_id" not in [key for key, _ in sort]:
+            sort.append(("_id", pymongo.ASCENDING))
+        sort_keys = [key for key, _ in sort]
+
+        query = dict(filter or {})
+        if not is_include_deleted:
+            query["_deleted"] = None
+        if cursor:
+            values = decode_page_cursor(sort_keys, cursor)
+            query = {"$and": [query, get_keyset_filter(sort, values)]}
+
+        # 投影中需要带上排序字段，才能生成下一页的游标
+        if isinstance(fields, dict) and any(fields.values()):
+            fields = dict(fields, **{key: 1 for key in sort_keys})
+        elif isinstance(fields, (list, tuple)):
+            fields = list(fields) + [key for key in sort_keys if key not in fields]
+
+        data = cls.find(
+            query,
+            fields=fields,
+            page_size=page_size + 1,
+            sort=sort,
+            is_include_deleted=True,
+        )
+
+        next_cursor = None
+        if len(data) > page_size:
+            data = data[:page_size]
+            last = data[-1]
+            next_cursor = encode_page_cursor(
+                sort_keys, [py_.get(last, key) for key in sort_keys]
+            )
+
+        if return_json:
+            data = get_json_result(data)
+        return {"data": data, "next_cursor": next_cursor}
+
+    @classmethod
+    def iter_find(
+        cls,
+        filter=None,
+        fields=None,
+        batch_size=1000,
+        sort=None,
+        is_include_deleted=False,
+        limit=-1,
+    ):
+        """按 batch_size 分批 keyset 遍历整个查询结果的生成器，内存中最多只有一批数据"""
+        cursor = None
+        count = 0
+        while True:
+            page = cls.find_page(
+                filter,
+                cursor=cursor,
+                page_size=batch_size,
+                sort=sort,
+                fields=fields,
+                is_include_deleted=is_include_deleted,
+            )
+            for item in page["data"]:
+                yield item
+                count += 1
+                if 0 < limit <= count:
+                    return
+
+            cursor = page["next_cursor"]
+            if not cursor:
+                return
+
     @classmethod
     def delete(cls, filter=None, real_delete=False, multi=False):
         start_time = time.time()
@@ -374,6 +1004,7 @@ class MongoBase(object):
             error = ex
             log_func = logging.error
         finally:
+            cls.invalidate_cache()
             log_func(
                 "delete from %s in %.3f seconds, error is %s",
                 col_name,
@@ -396,29 +1027,52 @@ class MongoBase(object):
                 result += ch.lower()
         return result + "s"
 
+    @classmethod
+    def get_cache(cls):
+        """开启了 __cache__ 时返回当前 collection 的 LRUCache，否则返回 None"""
+        if not cls.__cache__:
+            return None
+        options = cls.__cache__ if isinstance(cls.__cache__, dict) else {}
+        return mongo_cache.get_cache(cls.get_collection_name(), options)
+
+    @classmethod
+    def invalidate_cache(cls):
+        mongo_cache.invalidate(cls.get_collection_name())
+        identity_map.invalidate(cls.get_collection_name())
+        batch_loader.invalidate(cls.get_collection_name())
+
+    @classmethod
+    def get_identity_map(cls):
+        """开启了 __identity_map__ 且在请求上下文中时返回当前 collection 的 identity map"""
+        if not cls.__identity_map__:
+            return None
+        return identity_map.get_identity_map(cls.get_collection_name())
+
+    @classmethod
+    def cache_stats(cls):
+        cache = cls.get_cache()
+        return cache.stats() if cache else None
+
+    @classmethod
+    def sync_indexes(cls):
+        return mongo_index.sync_indexes(cls)
+
     @classmethod
     def get_collection(cls):
         return db()[cls.get_collection_name()]
 
     @classmethod
     def get_auto_increasing_id(cls):
-        col = db()["ids"]
-        where = {"name": cls.get_collection_name()}
-        update = {"$inc": {"id": 1}}
-        item = col.find_one_and_update(
-            where, update, upsert=True, return_document=pymongo.ReturnDocument.AFTER
-        )
-        return item["id"]
+        return cls.get_auto_increasing_ids(1)[0]
+
+    @classmethod
+    def get_auto_increasing_ids(cls, n):
+        """批量获取 n 个自增 id，供 insert_many 使用"""
+        return allocate_ids(cls.get_collection_name(), n, cls.__id_block_size__)
 
     @classmethod
     def set_auto_increasing_id(cls, id):
-        col = db()["ids"]
-        where = {"name": cls.get_collection_name()}
-        update = {"$set": {"id": id}}
-        item = col.find_one_and_update(
-            where, update, upsert=True, return_document=pymongo.ReturnDocument.AFTER
-        )
-        return item["id"]
+        return reset_ids(cls.get_collection_name(), id)
 
     @classmethod
     def aggregate(cls, match=None, return_cursor=False, allowDiskUse=False):
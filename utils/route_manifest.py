@@ -0,0 +1,300 @@
+import importlib
+import json
+import logging
+import os
+import threading
+import traceback
+
+from flask import Flask, request
+
+MANIFEST_VERSION = 2
+# 按蓝图名保存函数列表的注册信息，懒加载时从临时 app 合并到 app（错误处理 error_handler_spec 单独合并）；
+# 蓝图自己的 url_value_preprocessor / before_request 由 LazyView 执行，只合并其中 app 级（None）的部分
+MERGED_REGISTRIES = (
+    "after_request_funcs",
+    "teardown_request_funcs",
+    "template_context_processors",
+    "url_default_functions",
+)
+PREPROCESS_REGISTRIES = ("url_value_preprocessors", "before_request_funcs")
+
+
+def is_route_file(filename):
+    return filename.startswith("api") and filename.endswith(".py")
+
+
+def mod_name_to_route(mod_name):
+    parts = mod_name.split(".")
+
+    last = parts[-1]
+    if last == "api":
+        # 只取前面的部分
+        parts = parts[:-1]
+    elif last.startswith("api_"):
+        # 只保留 api_ 后的部分
+        parts = parts[:-1] + [last[4:]]
+
+    # 将所有 _ 替换成 /
+    path_parts = []
+    for part in parts:
+        path_parts.extend(part.split("_"))
+
+    # 拼接为路由路径
+    route = "/" + "/".join(path_parts)
+    return route
+
+
+def get_url_prefix(blueprint, mod_name):
+    url_prefix = blueprint.url_prefix
+    if url_prefix:
+        return "/api" + url_prefix
+    return "/api" + mod_name_to_route(mod_name)
+
+
+def scan_routes(package_path, package_name):
+    """遍历 package_path，返回路由文件列表和所有目录的 mtime"""
+    routes = []
+    dirs = {}
+    for root, _, files in os.walk(package_path):
+        dirs[os.path.relpath(root, package_path)] = os.stat(root).st_mtime
+        for file in files:
+            if not is_route_file(file):
+                continue
+            module_path = os.path.join(root, file)
+            rel_path = os.path.relpath(module_path, package_path)
+            mod_name = rel_path.replace(os.sep, ".")[:-3]  # 去掉 .py
+            routes.append(
+                {
+                    "path": rel_path,
+                    "mod_name": mod_name,
+                    "module": f"{package_name}.{mod_name}",
+                    "mtime": os.stat(module_path).st_mtime,
+                }
+            )
+    return routes, dirs
+
+
+def is_manifest_fresh(manifest, package_path):
+    """目录的 mtime 在增删文件时变化，文件的 mtime 在修改时变化，都没变时清单仍然有效"""
+    try:
+        for rel_dir, mtime in manifest["dirs"].items():
+            if os.stat(os.path.join(package_path, rel_dir)).st_mtime != mtime:
+                return False
+        for route in manifest["routes"]:
+            if os.stat(os.path.join(package_path, route["path"])).st_mtime != route["mtime"]:
+                return False
+    except (OSError, KeyError):
+        return False
+    return True
+
+
+def load_manifest(manifest_path, package_path, package_name):
+    """读取有效的路由清单，不存在、版本不同或文件有变化时返回 None"""
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (
+        manifest.get("version") != MANIFEST_VERSION
+        or manifest.get("package") != package_name
+        or not is_manifest_fresh(manifest, package_path)
+    ):
+        return None
+    return manifest
+
+
+def save_manifest(manifest_path, manifest):
+    # 先写临时文件再替换，多个 worker 同时启动时不会读到写了一半的文件
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def import_blueprint(route):
+    module = importlib.import_module(route["module"])
+    return getattr(module, "bp")
+
+
+def create_scratch_app(app=None):
+    """用于注册单个蓝图的临时 app，使用 app 的 url 转换器"""
+    scratch = Flask(__name__, static_folder=None)
+    if app is not None:
+        scratch.url_map.converters.update(app.url_map.converters)
+    return scratch
+
+
+def get_blueprint_rules(blueprint, url_prefix, app=None):
+    """把蓝图注册到临时 app 上，返回它的所有路由规则，HEAD 和自动添加的 OPTIONS 在注册时会重新加上"""
+    scratch = create_scratch_app(app)
+    scratch.register_blueprint(blueprint, url_prefix=url_prefix)
+    rules = []
+    for rule in scratch.url_map.iter_rules():
+        methods = set(rule.methods)
+        if getattr(rule, "provide_automatic_options", True):
+            methods.discard("OPTIONS")
+        if "GET" in methods:
+            methods.discard("HEAD")
+        rules.append(
+            {
+                "rule": rule.rule,
+                "endpoint": rule.endpoint,
+                "methods": sorted(methods),
+                "defaults": rule.defaults,
+                "strict_slashes": rule.strict_slashes,
+            }
+        )
+    return rules
+
+
+def build_manifest(package_path, package_name, app=None):
+    """导入所有路由模块得到 url 前缀和路由规则，返回 (清单, {module: blueprint})"""
+    routes, dirs = scan_routes(package_path, package_name)
+    blueprints = {}
+    valid_routes = []
+    for route in routes:
+        try:
+            blueprint = import_blueprint(route)
+        except Exception as e:
+            logging.error(f"Failed to register route from {route['path']}: {e}")
+            logging.error(traceback.format_exc())
+            continue
+        route["url_prefix"] = get_url_prefix(blueprint, route["mod_name"])
+        try:
+            route["rules"] = get_blueprint_rules(blueprint, route["url_prefix"], app)
+        except Exception as e:
+            logging.error(f"Failed to register route from {route['path']}: {e}")
+            logging.error(traceback.format_exc())
+            continue
+        blueprints[route["module"]] = blueprint
+        valid_routes.append(route)
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "package": package_name,
+        "dirs": dirs,
+        "routes": valid_routes,
+    }
+    return manifest, blueprints
+
+
+def merge_registries(app, scratch):
+    """把临时 app 上按蓝图名保存的钩子、错误处理等合并到 app，已有的函数不重复添加"""
+    for name, by_code in scratch.error_handler_spec.items():
+        target = app.error_handler_spec[name]
+        for code, handlers in by_code.items():
+            target[code].update(handlers)
+    for attr in MERGED_REGISTRIES + PREPROCESS_REGISTRIES:
+        registry = getattr(app, attr)
+        for name, funcs in getattr(scratch, attr).items():
+            if name is not None and attr in PREPROCESS_REGISTRIES:
+                continue
+            target = registry[name]
+            for func in funcs:
+                if func not in target:
+                    target.append(func)
+
+
+class LazyModule(object):
+    """
+    懒加载模式下的一个路由模块。启动时按清单中记录的路由规则（url、endpoint、methods）注册到 app，
+    视图为 LazyView，不导入模块；方法不匹配时和直接注册蓝图一样返回 405。
+    第一次请求命中时导入模块，把蓝图注册到临时 app 上得到真正的视图函数，
+    蓝图的 after_request、错误处理、模板上下文等合并到 app。运行期间不修改 url_map。
+    蓝图的 url_value_preprocessor 和 before_request 由 LazyView 在调用视图前执行（在 app 级的 before_request 之后）；
+    蓝图通过 app_template_filter 等方式注册到 app 上的其他内容不会生效
+    """
+
+    def __init__(self, app, route):
+        self.app = app
+        self.route = route
+        self.scratch = None
+        self.lock = threading.Lock()
+
+    def register(self):
+        views = {}
+        for rule in self.route["rules"]:
+            endpoint = rule["endpoint"]
+            # 同一个 endpoint 的多条规则必须使用同一个视图对象
+            view = views.setdefault(endpoint, LazyView(self, endpoint))
+            self.app.add_url_rule(
+                rule["rule"],
+                endpoint,
+                view,
+                methods=rule["methods"],
+                defaults=rule["defaults"],
+                strict_slashes=rule["strict_slashes"],
+            )
+
+    def load(self):
+        with self.lock:
+            if self.scratch is not None:
+                return self.scratch
+            blueprint = import_blueprint(self.route)
+            scratch = create_scratch_app(self.app)
+            scratch.register_blueprint(blueprint, url_prefix=self.route["url_prefix"])
+            merge_registries(self.app, scratch)
+            self.app.blueprints.setdefault(blueprint.name, blueprint)
+            self.scratch = scratch
+            logging.info(f"lazy loaded blueprint {self.route['module']}")
+        return scratch
+
+    def preprocess_blueprint(self, scratch):
+        """执行当前请求所属蓝图的 url_value_preprocessor 和 before_request"""
+        names = list(reversed(request.blueprints))
+        for name in names:
+            for url_func in scratch.url_value_preprocessors.get(name, ()):
+                url_func(request.endpoint, request.view_args)
+        for name in names:
+            for before_func in scratch.before_request_funcs.get(name, ()):
+                rv = self.app.ensure_sync(before_func)()
+                if rv is not None:
+                    return rv
+        return None
+
+
+class LazyView(object):
+    def __init__(self, module, endpoint):
+        self.module = module
+        self.endpoint = endpoint
+
+    def __call__(self, **kwargs):
+        scratch = self.module.scratch or self.module.load()
+        rv = self.module.preprocess_blueprint(scratch)
+        if rv is not None:
+            return rv
+        # url_value_preprocessor 可能修改了 view_args，按修改后的参数调用视图
+        view_func = scratch.view_functions[self.endpoint]
+        return self.module.app.ensure_sync(view_func)(**request.view_args)
+
+
+def register_routes(app, package_path, package_name, manifest_path=None, lazy=False):
+    """
+    注册 package_path 下所有 api*.py 中的蓝图，返回路由文件的绝对路径（用于 --reload 监听）。
+    manifest_path 不为空时使用按 mtime 失效的路由清单，清单有效时不需要遍历目录；
+    lazy 为 True 且清单有效时不导入任何路由模块，按清单注册路由规则，第一次请求命中时再导入
+    """
+    manifest = load_manifest(manifest_path, package_path, package_name) if manifest_path else None
+    blueprints = {}
+    if manifest is None:
+        manifest, blueprints = build_manifest(package_path, package_name, app)
+        if manifest_path:
+            try:
+                save_manifest(manifest_path, manifest)
+            except (OSError, TypeError) as e:
+                logging.warning(f"Failed to save route manifest {manifest_path}: {e}")
+
+    for route in manifest["routes"]:
+        blueprint = blueprints.get(route["module"])
+        if blueprint is None and lazy:
+            LazyModule(app, route).register()
+            continue
+        try:
+            if blueprint is None:
+                blueprint = import_blueprint(route)
+            app.register_blueprint(blueprint, url_prefix=route["url_prefix"])
+        except Exception as e:
+            logging.error(f"Failed to register route from {route['path']}: {e}")
+            logging.error(traceback.format_exc())
+
+    return [os.path.join(package_path, route["path"]) for route in manifest["routes"]]
@@ -0,0 +1,127 @@
+import time
+from contextvars import ContextVar
+
+from pymongo import monitoring
+
+# 当前请求的耗时统计；async 视图和 AsyncMongoBase 的线程池会复制 context，拿到的是同一个对象
+_current_timing = ContextVar("server_timing", default=None)
+
+
+class RequestTiming(object):
+    """单个请求的耗时拆分，单位为秒"""
+
+    __slots__ = (
+        "start_time",
+        "mongo_count",
+        "mongo_time",
+        "serialize_time",
+        "view_time",
+        "view_end",
+        "end_time",
+        "reported",
+    )
+
+    def __init__(self):
+        # 和 app.py 中的 g.start_time 同时记录，用 perf_counter 且不经过 g，开销更小
+        self.start_time = time.perf_counter()
+        self.mongo_count = 0
+        self.mongo_time = 0.0
+        self.serialize_time = 0.0
+        self.view_time = 0.0
+        self.view_end = None
+        # 调试工具栏渲染 html 之前调用 stop_timing 固定结束时间，渲染耗时不计入 serialize
+        self.end_time = None
+        # dev_toolbar 会对包装后的响应再执行一遍 after_request，同一个请求只添加一次响应头
+        self.reported = False
+
+
+def get_timing():
+    """当前请求的 RequestTiming，没有开启或不在请求中时返回 None"""
+    return _current_timing.get()
+
+
+def stop_timing():
+    """固定当前请求的结束时间，之后的耗时（调试工具栏渲染等）不再计入"""
+    timing = _current_timing.get()
+    if timing is not None and timing.end_time is None:
+        timing.end_time = time.perf_counter()
+
+
+def record_view_time(start_time):
+    """request_wrapper 在视图函数返回后调用，记录视图耗时和结束时间"""
+    timing = _current_timing.get()
+    if timing is not None:
+        end_time = time.perf_counter()
+        timing.view_time += end_time - start_time
+        timing.view_end = end_time
+
+
+class ServerTimingListener(monitoring.CommandListener):
+    """把 mongo 命令的次数和耗时累加到当前请求，不在请求中的命令直接忽略"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        timing = _current_timing.get()
+        if timing is not None:
+            timing.mongo_count += 1
+            timing.mongo_time += event.duration_micros / 1e6
+
+    def failed(self, event):
+        self.succeeded(event)
+
+
+def format_server_timing(timing):
+    """
+    total;dur=12.3, mongo;dur=4.1;desc="3 calls", serialize;dur=1.2, view;dur=7.0
+    serialize 包含 get_json_result 和视图返回后生成 json 响应的时间，
+    view 为视图函数中除去 mongo 和 get_json_result 的时间（没有 request_wrapper 时按总耗时计算）
+    """
+    now = timing.end_time or time.perf_counter()
+    total = now - timing.start_time
+    serialize = timing.serialize_time
+    if timing.view_end is not None:
+        serialize += now - timing.view_end
+        view = timing.view_time
+    else:
+        view = total
+    # async 视图并发执行的 mongo 命令耗时会重叠，不能出现负数
+    view = max(view - timing.mongo_time - timing.serialize_time, 0.0)
+    # % 格式化比 f-string 中逐个 :.2f 快
+    return 'total;dur=%.2f, mongo;dur=%.2f;desc="%d calls", serialize;dur=%.2f, view;dur=%.2f' % (
+        total * 1000,
+        timing.mongo_time * 1000,
+        timing.mongo_count,
+        serialize * 1000,
+        view * 1000,
+    )
+
+
+def register_server_timing(app, config, section="SERVER_TIMING"):
+    """所有响应加上 Server-Timing 头，浏览器 devtools 和负载均衡日志中可以看到耗时拆分"""
+    if not config.getboolean(section, "ENABLED", fallback=False):
+        return None
+
+    listener = ServerTimingListener()
+    monitoring.register(listener)
+
+    @app.before_request
+    def before_request_timing():
+        _current_timing.set(RequestTiming())
+
+    @app.after_request
+    def after_request_timing(response):
+        timing = _current_timing.get()
+        if timing is not None and not timing.reported:
+            timing.reported = True
+            # Server-Timing 允许出现多次，add 比 __setitem__ 少一次查找删除
+            response.headers.add("Server-Timing", format_server_timing(timing))
+        return response
+
+    @app.teardown_request
+    def teardown_request_timing(exc):
+        # 同一线程中请求之后执行的 mongo 命令（定时任务等）不再计入
+        _current_timing.set(None)
+
+    return listener
@@ -1,24 +1,54 @@
+import asyncio
 import functools
+import time
 import traceback
 import json
 
 from flask import request, Response, current_app
 from utils import http_response
-from utils.encode_util import CustomJSONEncoder
+from utils.encode_util import to_json_safe
+from utils.server_timing import get_timing, record_view_time
 
 
 def request_wrapper():
     def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            return async_decorator(func)
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
             try:
                 data = func(*args, **kwargs)
+                record_view_time(start_time)
+
+                if isinstance(data, Response):
+                    return data
+
+                return http_response.get_success(data)
+            except Exception as ex:
+                record_view_time(start_time)
+                current_app.logger.error(repr(ex))
+                current_app.logger.error(traceback.format_exc())
+                return http_response.get_error(msg=repr(ex))
+
+        return wrapper
+
+    def async_decorator(func):
+        # async def 视图，flask 2.x 会通过 ensure_sync 执行返回的协程函数
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                data = await func(*args, **kwargs)
+                record_view_time(start_time)
 
                 if isinstance(data, Response):
                     return data
 
                 return http_response.get_success(data)
             except Exception as ex:
+                record_view_time(start_time)
                 current_app.logger.error(repr(ex))
                 current_app.logger.error(traceback.format_exc())
                 return http_response.get_error(msg=repr(ex))
@@ -83,5 +113,12 @@ def get_data_param(data, name, default=None, type_=None):
 
 
 def get_json_result(result):
-    # TODO 待优化，这里最好写成递归的，避免 json 转换损耗
-    return json.loads(json.dumps(result, cls=CustomJSONEncoder))
+    timing = get_timing()
+    if timing is None:
+        return to_json_safe(result)
+
+    # 计入 Server-Timing 的 serialize
+    start_time = time.perf_counter()
+    result = to_json_safe(result)
+    timing.serialize_time += time.perf_counter() - start_time
+    return result